@@ -1,4 +1,5 @@
 import environ
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 import os
 
@@ -27,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'corsheaders',
+    'trip',
 ]
 
 MIDDLEWARE = [
@@ -86,3 +88,49 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 OPENROUTESERVICE_API_KEY = env("OPENROUTESERVICE_API_KEY", default="")
+
+# Routing backend: "ors" (hosted API) or "local" (graph built with `manage.py build_road_graph`)
+ROUTING_BACKEND = env("ROUTING_BACKEND", default="ors")
+ROAD_GRAPH_PATH = env("ROAD_GRAPH_PATH", default="")
+if ROUTING_BACKEND not in ("ors", "local"):
+    raise ImproperlyConfigured(f"ROUTING_BACKEND must be 'ors' or 'local', not {ROUTING_BACKEND!r}")
+if ROUTING_BACKEND == "local" and not ROAD_GRAPH_PATH:
+    raise ImproperlyConfigured("ROUTING_BACKEND=local requires ROAD_GRAPH_PATH")
+ROAD_GRAPH_SNAP_KM = env.float("ROAD_GRAPH_SNAP_KM", default=5.0)
+
+# Upstream map providers: request timeouts and per-provider circuit breaker
+MAP_REQUEST_TIMEOUT_SECONDS = env.float("MAP_REQUEST_TIMEOUT_SECONDS", default=10.0)
+MAP_RETRY_TIMEOUT_SECONDS = env.float("MAP_RETRY_TIMEOUT_SECONDS", default=2.0)
+NOMINATIM_TIMEOUT_SECONDS = env.float("NOMINATIM_TIMEOUT_SECONDS", default=2.0)
+MAP_BREAKER_FAILURE_THRESHOLD = env.int("MAP_BREAKER_FAILURE_THRESHOLD", default=5)
+MAP_BREAKER_RESET_SECONDS = env.float("MAP_BREAKER_RESET_SECONDS", default=30.0)
+
+# Degraded mode: plan from cached values, the local road graph (ROAD_GRAPH_PATH)
+# or straight-line distance x MAP_DETOUR_FACTOR instead of failing with 502
+MAP_DEGRADED_MODE = env.bool("MAP_DEGRADED_MODE", default=True)
+MAP_DETOUR_FACTOR = env.float("MAP_DETOUR_FACTOR", default=1.3)
+MAP_FALLBACK_SPEED_KPH = env.float("MAP_FALLBACK_SPEED_KPH", default=80.0)
+
+# Memory-mapped leg geometry store shared by all workers (empty disables it)
+ROUTE_STORE_PATH = env("ROUTE_STORE_PATH", default="")
+
+# Truck stop / fuel station dataset (CSV: name,kind,lon,lat) used to snap rests and refuels
+POI_DATASET_PATH = env("POI_DATASET_PATH", default="")
+POI_CORRIDOR_KM = env.float("POI_CORRIDOR_KM", default=5.0)
+POI_LOOKBACK_KM = env.float("POI_LOOKBACK_KM", default=80.0)
+
+# Background plan jobs (/api/plan-jobs/)
+PLAN_JOB_WORKERS = env.int("PLAN_JOB_WORKERS", default=4)
+PLAN_JOB_MAX_WAIT_SECONDS = env.float("PLAN_JOB_MAX_WAIT_SECONDS", default=25.0)
+PLAN_JOB_STALE_SECONDS = env.float("PLAN_JOB_STALE_SECONDS", default=600.0)
+
+# Re-planning: max distance (km) from the stored route for the truck to count as on-route
+REPLAN_ON_ROUTE_KM = env.float("REPLAN_ON_ROUTE_KM", default=1.0)
+# Plans stored for re-planning ("replannable": true) and finished plan jobs
+# expire after this many hours
+TRIP_PLAN_TTL_HOURS = env.float("TRIP_PLAN_TTL_HOURS", default=48.0)
+
+# Per-request profiling of /api/plan-trip/ (X-Plan-Profile: 1 header or ?profile=1)
+PLAN_PROFILING_ENABLED = env.bool("PLAN_PROFILING_ENABLED", default=False)
+# an empty value in .env also means the default directory
+PLAN_PROFILE_DIR = env("PLAN_PROFILE_DIR", default="") or str(BASE_DIR / "profiles")
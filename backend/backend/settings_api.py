@@ -0,0 +1,35 @@
+"""
+API-only settings profile.
+
+Installs only what the JSON API under /api/ needs: no admin, auth,
+sessions, messages, templates or static files, and no CSRF/session
+middleware. Select it with DJANGO_SETTINGS_MODULE=backend.settings_api.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'corsheaders',
+    'trip',
+]
+
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'backend.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+USE_I18N = False
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+}
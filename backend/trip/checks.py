@@ -0,0 +1,18 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_road_graph(app_configs, **kwargs):
+    """The local routing backend needs a readable graph file (built by `build_road_graph`)."""
+    if settings.ROUTING_BACKEND != "local" or os.path.isfile(settings.ROAD_GRAPH_PATH):
+        return []
+    return [
+        Error(
+            f"ROAD_GRAPH_PATH {settings.ROAD_GRAPH_PATH!r} does not exist",
+            hint="Build it with `python manage.py build_road_graph NODES_CSV EDGES_CSV OUTPUT`.",
+            id="trip.E001",
+        )
+    ]
@@ -0,0 +1,116 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter so every measurement is a cold start.
+PROBE = r"""
+import json, math, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t_setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import resolve
+application = get_wsgi_application()
+resolve('/api/plan-trip/')
+t_app = time.perf_counter()
+
+# Stub only the ORS/Nominatim round-trips: MapClient is still constructed, so the
+# lazy openrouteservice import is paid by the first request and measured there.
+from trip.services.map_client import MapClient
+PLACES = {'a': (-96.80, 32.78), 'b': (-95.37, 29.76), 'c': (-90.07, 29.95)}
+
+def km(p, q):
+    return math.hypot((p[0] - q[0]) * 111 * math.cos(math.radians(p[1])), (p[1] - q[1]) * 111)
+
+def call_ors(self, method, **kwargs):
+    if method == 'pelias_search':
+        return {'features': [{'geometry': {'coordinates': list(PLACES[kwargs['text']])}}]}
+    if method == 'directions':
+        (x0, y0), (x1, y1) = kwargs['coordinates']
+        line = [[x0 + (x1 - x0) * i / 200, y0 + (y1 - y0) * i / 200] for i in range(201)]
+        return {'features': [{'geometry': {'coordinates': line}}]}
+    locs = kwargs['locations']
+    sources = [locs[i] for i in kwargs.get('sources', range(len(locs)))]
+    destinations = [locs[i] for i in kwargs.get('destinations', range(len(locs)))]
+    result = {}
+    if 'duration' in kwargs['metrics']:
+        result['durations'] = [[km(p, q) * 3600 / 80 for q in destinations] for p in sources]
+    if 'distance' in kwargs['metrics']:
+        result['distances'] = [[km(p, q) * 1000 for q in destinations] for p in sources]
+    return result
+
+MapClient._call_ors = call_ors
+MapClient.reverse_geocode = lambda self, lat, lon: 'Somewhere, TX'
+
+from django.test import Client
+client = Client()
+body = {'current_location': 'a', 'pickup_location': 'b', 'dropoff_location': 'c', 'cycle_used_hours': 10}
+first = client.post('/api/plan-trip/', body, content_type='application/json')
+t_first = time.perf_counter()
+client.post('/api/plan-trip/', body, content_type='application/json')
+t_second = time.perf_counter()
+heavy = ['openrouteservice', 'geopy', 'whitenoise', 'django.contrib.sessions', 'django.contrib.messages']
+print(json.dumps({
+    'setup_ms': (t_setup - t0) * 1000,
+    'app_ms': (t_app - t_setup) * 1000,
+    'first_request_ms': (t_first - t_app) * 1000,
+    'second_request_ms': (t_second - t_first) * 1000,
+    'status': first.status_code,
+    'modules': len(sys.modules),
+    'heavy_loaded': [m for m in heavy if m in sys.modules],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure cold-start import time and first-plan latency (stubbed upstream) for settings profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--settings-module",
+            action="append",
+            dest="settings_modules",
+            help="Settings module to benchmark (repeatable). "
+                 "Defaults to backend.settings and backend.settings_api.",
+        )
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        modules = options["settings_modules"] or ["backend.settings", "backend.settings_api"]
+        for module in modules:
+            samples = [self._probe(module) for _ in range(options["runs"])]
+            summary = {
+                key: statistics.median(s[key] for s in samples)
+                for key in ("process_ms", "setup_ms", "app_ms", "first_request_ms", "second_request_ms", "modules")
+            }
+            self.stdout.write(
+                f"{module}: process {summary['process_ms']:.0f} ms, "
+                f"django.setup {summary['setup_ms']:.0f} ms, "
+                f"wsgi+urls {summary['app_ms']:.0f} ms, "
+                f"first plan {summary['first_request_ms']:.1f} ms (HTTP {samples[-1]['status']}), "
+                f"second plan {summary['second_request_ms']:.1f} ms, "
+                f"{summary['modules']:.0f} modules, "
+                f"heavy loaded: {', '.join(samples[-1]['heavy_loaded']) or 'none'}"
+            )
+
+    def _probe(self, module: str) -> dict:
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=module)
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            env=env,
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - start) * 1000
+        return result
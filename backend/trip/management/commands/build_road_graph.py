@@ -0,0 +1,44 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip.services.local_router import RoadGraph
+
+
+class Command(BaseCommand):
+    # builds the file that the ROAD_GRAPH_PATH system check looks for
+    requires_system_checks = []
+    help = (
+        "Convert a road network extract (e.g. an OSM extract exported with "
+        "osmnx/pyrosm) into the compact CSR graph file used by the local router. "
+        "NODES_CSV needs id,lon,lat columns; EDGES_CSV needs "
+        "from,to,length_m,duration_s with one row per driving direction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("nodes_csv")
+        parser.add_argument("edges_csv")
+        parser.add_argument("output")
+
+    def handle(self, *args, **options):
+        node_ids = {}
+        nodes = []
+        with open(options["nodes_csv"], newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                node_ids[row["id"]] = len(nodes)
+                nodes.append((float(row["lon"]), float(row["lat"])))
+
+        edges = []
+        with open(options["edges_csv"], newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    u, v = node_ids[row["from"]], node_ids[row["to"]]
+                except KeyError as e:
+                    raise CommandError(f"Edge references unknown node {e}")
+                edges.append((u, v, float(row["length_m"]), float(row["duration_s"])))
+
+        graph = RoadGraph.from_edges(nodes, edges)
+        graph.save(options["output"])
+        self.stdout.write(
+            f"Wrote {graph.num_nodes} nodes and {graph.num_edges} edges to {options['output']}"
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-19 16:27
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripPlan',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('input', models.JSONField()),
+                ('coords', models.JSONField()),
+                ('drive_times', models.JSONField()),
+                ('leg_distances', models.JSONField()),
+                ('route_geometries', models.JSONField()),
+                ('route_km', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0002_trip_plan'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tripplan',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip', '0003_trip_plan_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='planjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
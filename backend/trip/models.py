@@ -1,3 +1,52 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class PlanJob(models.Model):
+    """
+    A trip plan executed in the background. `input_key` is a hash of the
+    normalized input so duplicate submissions share one job.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    input_key = models.CharField(max_length=64, unique=True)
+    input = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(null=True, blank=True)
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in self.FINISHED_STATUSES
+
+
+class TripPlan(models.Model):
+    """
+    The resolved inputs of a generated plan (coordinates, leg drive times,
+    distances, geometries and their cumulative-km indexes), kept so the trip
+    can be re-planned from a GPS position without calling the map providers.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    input = models.JSONField()
+    coords = models.JSONField()
+    drive_times = models.JSONField()
+    leg_distances = models.JSONField()
+    route_geometries = models.JSONField()
+    route_km = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -5,3 +5,16 @@ class TripInputSerializer(serializers.Serializer):
     pickup_location = serializers.CharField(max_length=255)
     dropoff_location = serializers.CharField(max_length=255)
     cycle_used_hours = serializers.FloatField()
+    # keep the resolved plan so it can be re-planned from /api/plans/<plan_id>/replan/
+    replannable = serializers.BooleanField(default=False)
+
+
+class ReplanInputSerializer(serializers.Serializer):
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    current_time = serializers.FloatField(min_value=0, max_value=24)
+    driving_hours = serializers.FloatField(min_value=0, default=0.0)
+    duty_hours = serializers.FloatField(min_value=0, default=0.0)
+    cycle_used_hours = serializers.FloatField()
+    km_since_refuel = serializers.FloatField(min_value=0, default=0.0)
+    leg = serializers.ChoiceField(choices=["leg1", "leg2"], required=False)
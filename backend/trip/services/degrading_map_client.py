@@ -0,0 +1,248 @@
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from trip.services.circuit_breaker import get_breaker
+from trip.services.map_client import NOMINATIM_BREAKER, MapAPIError, MapClientProtocol
+from trip.utils.geo import haversine_km
+
+T = TypeVar("T")
+
+UNKNOWN_LOCATION = "Unknown Location"
+
+
+class _LRUCache(Generic[T]):
+    """Small thread-safe LRU map shared by every request in the process."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, T]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+# last known good upstream answers, keyed by address or rounded coordinates
+_geocodes: _LRUCache[Tuple[float, float]] = _LRUCache(1024)
+_durations: _LRUCache[float] = _LRUCache(1024)
+_distances: _LRUCache[float] = _LRUCache(1024)
+_geometries: _LRUCache[List[Tuple[float, float]]] = _LRUCache(256)
+_places: _LRUCache[str] = _LRUCache(4096)
+
+
+def _pair_key(start: Tuple[float, float], end: Tuple[float, float]) -> Tuple[float, ...]:
+    return (round(start[0], 5), round(start[1], 5), round(end[0], 5), round(end[1], 5))
+
+
+def _place_key(lat: float, lon: float) -> Tuple[float, float]:
+    # ~100 m: close enough for a "City, State" label
+    return (round(lat, 3), round(lon, 3))
+
+
+class DegradingMapClient(MapClientProtocol):
+    """
+    Wraps the configured map client so upstream failures (including an open
+    circuit breaker) degrade the plan instead of failing it. Per leg, answers
+    fall back to the last cached upstream value, then to the local road-graph
+    estimator if one is configured, then to straight-line distance times
+    `detour_factor` driven at `fallback_speed_kph`. Geocoding falls back to
+    the cache only: an address cannot be estimated.
+
+    Every fallback taken is recorded in `degraded_reasons`.
+    """
+
+    def __init__(
+        self,
+        primary: MapClientProtocol,
+        estimator: Optional[Callable[[], MapClientProtocol]] = None,
+        detour_factor: float = 1.3,
+        fallback_speed_kph: float = 80.0,
+    ):
+        self.primary = primary
+        self.estimator_factory = estimator
+        self.detour_factor = detour_factor
+        self.fallback_speed_kph = fallback_speed_kph
+        self.degraded_reasons: List[str] = []
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.degraded_reasons)
+
+    @cached_property
+    def estimator(self) -> Optional[MapClientProtocol]:
+        """Local estimator, built on first fallback so a healthy upstream never loads it."""
+        if self.estimator_factory is None:
+            return None
+        try:
+            return self.estimator_factory()
+        except (OSError, ValueError):
+            return None
+
+    def _degrade(self, reason: str) -> None:
+        if reason not in self.degraded_reasons:
+            self.degraded_reasons.append(reason)
+
+    def _fallback(
+        self,
+        what: str,
+        cache: _LRUCache[T],
+        key: Hashable,
+        estimate: Callable[[MapClientProtocol], T],
+        straight_line: Callable[[], T],
+    ) -> T:
+        cached = cache.get(key)
+        if cached is not None:
+            self._degrade(f"{what} from cache")
+            return cached
+        if self.estimator is not None:
+            try:
+                value = estimate(self.estimator)
+                self._degrade(f"{what} from local estimator")
+                return value
+            except MapAPIError:
+                pass
+        self._degrade(f"{what} from straight-line estimate")
+        return straight_line()
+
+    def _straight_km(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
+        return haversine_km(start, end) * self.detour_factor
+
+    def batch_address_to_coords(self, addresses: List[str]) -> List[Tuple[float, float]]:
+        try:
+            coords = self.primary.batch_address_to_coords(addresses)
+        except MapAPIError:
+            cached = [_geocodes.get(address) for address in addresses]
+            if any(c is None for c in cached):
+                raise
+            self._degrade("geocoding from cache")
+            return cached
+        for address, c in zip(addresses, coords):
+            _geocodes.put(address, c)
+        return coords
+
+    def durations_from_coords(self, locations: List[Tuple[float, float]]) -> List[float]:
+        if len(locations) < 2:
+            raise ValueError("At least two coordinates are required to compute durations.")
+        pairs = list(zip(locations, locations[1:]))
+        try:
+            durations = self.primary.durations_from_coords(locations)
+        except MapAPIError:
+            return [
+                self._fallback(
+                    "durations",
+                    _durations,
+                    _pair_key(start, end),
+                    lambda client: client.durations_from_coords([start, end])[0],
+                    lambda: self._straight_km(start, end) / self.fallback_speed_kph,
+                )
+                for start, end in pairs
+            ]
+        for (start, end), duration in zip(pairs, durations):
+            _durations.put(_pair_key(start, end), duration)
+        return durations
+
+    def get_route_geometries(self, locations: List[Tuple[float, float]]) -> List[List[Tuple[float, float]]]:
+        if len(locations) < 2:
+            raise ValueError("At least two coordinates are required to compute routes.")
+        pairs = list(zip(locations, locations[1:]))
+        try:
+            geometries = self.primary.get_route_geometries(locations)
+        except MapAPIError:
+            return [
+                self._fallback(
+                    "route geometry",
+                    _geometries,
+                    _pair_key(start, end),
+                    lambda client: client.get_route_geometries([start, end])[0],
+                    lambda: [list(start), list(end)],
+                )
+                for start, end in pairs
+            ]
+        for (start, end), geometry in zip(pairs, geometries):
+            _geometries.put(_pair_key(start, end), geometry)
+        return geometries
+
+    def get_total_distance(self, locations: List[Tuple[float, float]]) -> float:
+        start, end = locations[0], locations[1]
+        try:
+            distance = self.primary.get_total_distance(locations)
+        except MapAPIError:
+            return self._fallback(
+                "distance",
+                _distances,
+                _pair_key(start, end),
+                lambda client: client.get_total_distance([start, end]),
+                lambda: self._straight_km(start, end),
+            )
+        _distances.put(_pair_key(start, end), distance)
+        return distance
+
+    def matrix(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> Dict[str, List[List[float]]]:
+        try:
+            result = self.primary.matrix(sources, destinations)
+        except MapAPIError:
+            return {
+                "durations": [
+                    [
+                        self._fallback(
+                            "durations",
+                            _durations,
+                            _pair_key(start, end),
+                            lambda client: client.matrix([start], [end])["durations"][0][0],
+                            lambda: self._straight_km(start, end) / self.fallback_speed_kph,
+                        )
+                        for end in destinations
+                    ]
+                    for start in sources
+                ],
+                "distances": [
+                    [
+                        self._fallback(
+                            "distance",
+                            _distances,
+                            _pair_key(start, end),
+                            lambda client: client.matrix([start], [end])["distances"][0][0],
+                            lambda: self._straight_km(start, end),
+                        )
+                        for end in destinations
+                    ]
+                    for start in sources
+                ],
+            }
+        for i, start in enumerate(sources):
+            for j, end in enumerate(destinations):
+                _durations.put(_pair_key(start, end), result["durations"][i][j])
+                _distances.put(_pair_key(start, end), result["distances"][i][j])
+        return result
+
+    def interpolate_along_route(self, route: List[Tuple[float, float]], current_km: float) -> Tuple[float, float]:
+        return self.primary.interpolate_along_route(route, current_km)
+
+    def reverse_geocode(self, lat: float, lon: float) -> str:
+        key = _place_key(lat, lon)
+        if get_breaker(NOMINATIM_BREAKER).is_open:
+            # don't wait on a provider known to be down
+            self._degrade("stop names unavailable")
+            return _places.get(key) or UNKNOWN_LOCATION
+        name = self.primary.reverse_geocode(lat, lon)
+        if name != UNKNOWN_LOCATION:
+            _places.put(key, name)
+            return name
+        return _places.get(key) or name
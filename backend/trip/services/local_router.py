@@ -0,0 +1,362 @@
+import heapq
+import math
+import struct
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from trip.services.map_client import MapAPIError, MapClientProtocol
+from trip.utils.geo import cumulative_km, haversine_km, interpolate_at_km
+
+
+class RouteNotFoundError(MapAPIError): pass
+
+
+class RoadGraph:
+    """
+    Directed road graph in compressed sparse row (CSR) form: the outgoing
+    edges of node u are targets[offsets[u]:offsets[u + 1]], with per-edge
+    length (meters) and travel time (seconds) in parallel arrays.
+
+    Snapping uses a grid index in the same style: cell_keys holds the sorted
+    keys of non-empty CELL_DEG cells and the nodes of cell_keys[k] are
+    cell_nodes[cell_offsets[k]:cell_offsets[k + 1]]. The index and the
+    fastest edge speed are computed once at build time and stored in the
+    file, so loading a graph does no per-node Python work.
+    """
+
+    MAGIC = b"DPRGRAP2"
+    # magic, node count, edge count, non-empty cell count, max edge speed (m/s)
+    HEADER = struct.Struct("<8sQQQd")
+    CELL_DEG = 0.05
+    _CELL_BIAS = 1 << 24
+
+    def __init__(
+        self,
+        lon: array,
+        lat: array,
+        offsets: array,
+        targets: array,
+        length_m: array,
+        time_s: array,
+        cell_keys: array,
+        cell_offsets: array,
+        cell_nodes: array,
+        max_speed_mps: float,
+    ):
+        self.lon = lon
+        self.lat = lat
+        self.offsets = offsets
+        self.targets = targets
+        self.length_m = length_m
+        self.time_s = time_s
+        self.cell_keys = cell_keys
+        self.cell_offsets = cell_offsets
+        self.cell_nodes = cell_nodes
+        self.max_speed_mps = max_speed_mps
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.lon)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(
+        cls,
+        nodes: Sequence[Tuple[float, float]],
+        edges: Iterable[Tuple[int, int, float, float]],
+    ) -> "RoadGraph":
+        """
+        Build the CSR arrays from (lon, lat) nodes and directed
+        (from, to, length_m, time_s) edges; two-way roads need both directions.
+        """
+        edge_list = sorted(edges, key=lambda e: e[0])
+        offsets = array("q", [0] * (len(nodes) + 1))
+        for u, _, _, _ in edge_list:
+            offsets[u + 1] += 1
+        for i in range(len(nodes)):
+            offsets[i + 1] += offsets[i]
+
+        by_cell = sorted(range(len(nodes)), key=lambda i: cls.cell_key(*cls.cell_of(*nodes[i])))
+        cell_keys, cell_offsets = array("q"), array("q")
+        for position, node in enumerate(by_cell):
+            key = cls.cell_key(*cls.cell_of(*nodes[node]))
+            if not cell_keys or cell_keys[-1] != key:
+                cell_keys.append(key)
+                cell_offsets.append(position)
+        cell_offsets.append(len(by_cell))
+
+        # fastest edge speed keeps the A* time heuristic admissible
+        max_speed = max((e[2] / e[3] for e in edge_list if e[3] > 0), default=1.0)
+        return cls(
+            lon=array("d", (n[0] for n in nodes)),
+            lat=array("d", (n[1] for n in nodes)),
+            offsets=offsets,
+            targets=array("i", (e[1] for e in edge_list)),
+            length_m=array("f", (e[2] for e in edge_list)),
+            time_s=array("f", (e[3] for e in edge_list)),
+            cell_keys=cell_keys,
+            cell_offsets=cell_offsets,
+            cell_nodes=array("i", by_cell),
+            max_speed_mps=max_speed,
+        )
+
+    @classmethod
+    def cell_of(cls, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / cls.CELL_DEG), math.floor(lat / cls.CELL_DEG))
+
+    @classmethod
+    def cell_key(cls, cx: int, cy: int) -> int:
+        """Single sortable int64 for a cell."""
+        return (cx + cls._CELL_BIAS) * (2 * cls._CELL_BIAS) + (cy + cls._CELL_BIAS)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(
+                self.MAGIC, self.num_nodes, self.num_edges, len(self.cell_keys), self.max_speed_mps
+            ))
+            for arr in (
+                self.lon, self.lat, self.offsets, self.targets, self.length_m, self.time_s,
+                self.cell_keys, self.cell_offsets, self.cell_nodes,
+            ):
+                f.write(arr.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with open(path, "rb") as f:
+            header = f.read(cls.HEADER.size)
+            if len(header) < cls.HEADER.size:
+                raise ValueError(f"{path} is not a road graph file (too short)")
+            magic, n_nodes, n_edges, n_cells, max_speed = cls.HEADER.unpack(header)
+            if magic != cls.MAGIC:
+                raise ValueError(
+                    f"{path} is not a road graph file (or predates the stored snapping index; "
+                    f"rebuild it with `manage.py build_road_graph`)"
+                )
+
+            def read(typecode: str, count: int) -> array:
+                arr = array(typecode)
+                data = f.read(arr.itemsize * count)
+                if len(data) < arr.itemsize * count:
+                    raise ValueError(f"{path} is truncated; rebuild it with `manage.py build_road_graph`")
+                arr.frombytes(data)
+                return arr
+
+            return cls(
+                lon=read("d", n_nodes),
+                lat=read("d", n_nodes),
+                offsets=read("q", n_nodes + 1),
+                targets=read("i", n_edges),
+                length_m=read("f", n_edges),
+                time_s=read("f", n_edges),
+                cell_keys=read("q", n_cells),
+                cell_offsets=read("q", n_cells + 1),
+                cell_nodes=read("i", n_nodes),
+                max_speed_mps=max_speed,
+            )
+
+    def coords(self, node: int) -> Tuple[float, float]:
+        return (self.lon[node], self.lat[node])
+
+    def cell_nodes_of(self, cx: int, cy: int) -> Sequence[int]:
+        key = self.cell_key(cx, cy)
+        k = bisect_left(self.cell_keys, key)
+        if k == len(self.cell_keys) or self.cell_keys[k] != key:
+            return ()
+        return self.cell_nodes[self.cell_offsets[k]:self.cell_offsets[k + 1]]
+
+    def nearest_node(self, lon: float, lat: float, max_km: float) -> int:
+        cx, cy = self.cell_of(lon, lat)
+        # degrees of longitude shrink with latitude
+        rx = int(math.ceil(max_km / max(1e-6, 111.0 * math.cos(math.radians(lat))) / self.CELL_DEG))
+        ry = int(math.ceil(max_km / 111.0 / self.CELL_DEG))
+        best_km, best_node = math.inf, -1
+        for dx in range(-rx, rx + 1):
+            for dy in range(-ry, ry + 1):
+                for node in self.cell_nodes_of(cx + dx, cy + dy):
+                    dist = haversine_km((lon, lat), self.coords(node))
+                    if dist < best_km:
+                        best_km, best_node = dist, node
+        if best_km > max_km:
+            raise RouteNotFoundError(f"No road within {max_km} km of ({lon}, {lat})")
+        return best_node
+
+    def shortest_path(self, source: int, target: int) -> Tuple[float, float, List[int]]:
+        """
+        A* on travel time. Returns (seconds, meters, node path).
+        """
+        target_coords = self.coords(target)
+        speed_kmps = self.max_speed_mps / 1000
+
+        def heuristic(node: int) -> float:
+            return haversine_km(self.coords(node), target_coords) / speed_kmps
+
+        best: Dict[int, float] = {source: 0.0}
+        parent: Dict[int, Tuple[int, int]] = {}  # node -> (previous node, edge index)
+        heap = [(heuristic(source), 0.0, source)]
+        offsets, targets, time_s = self.offsets, self.targets, self.time_s
+
+        while heap:
+            _, cost, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if cost > best[u]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                new_cost = cost + time_s[e]
+                if new_cost < best.get(v, math.inf):
+                    best[v] = new_cost
+                    parent[v] = (u, e)
+                    heapq.heappush(heap, (new_cost + heuristic(v), new_cost, v))
+        else:
+            raise RouteNotFoundError(f"No route between nodes {source} and {target}")
+
+        path = [target]
+        meters = 0.0
+        node = target
+        while node != source:
+            node, e = parent[node]
+            meters += self.length_m[e]
+            path.append(node)
+        path.reverse()
+        return best[target], meters, path
+
+    def one_to_many(self, source: int, targets: Sequence[int]) -> Tuple[List[float], List[float]]:
+        """
+        Dijkstra from `source` until every node in `targets` is settled.
+        Returns (seconds, meters) per target; raises RouteNotFoundError if
+        any target is unreachable.
+        """
+        remaining = set(targets)
+        best: Dict[int, float] = {source: 0.0}
+        meters: Dict[int, float] = {source: 0.0}
+        settled = set()
+        heap = [(0.0, source)]
+        offsets, edge_targets, time_s, length_m = self.offsets, self.targets, self.time_s, self.length_m
+
+        while heap and remaining:
+            cost, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            remaining.discard(u)
+            for e in range(offsets[u], offsets[u + 1]):
+                v = edge_targets[e]
+                new_cost = cost + time_s[e]
+                if new_cost < best.get(v, math.inf):
+                    best[v] = new_cost
+                    meters[v] = meters[u] + length_m[e]
+                    heapq.heappush(heap, (new_cost, v))
+
+        if remaining:
+            raise RouteNotFoundError(f"No route from node {source} to nodes {sorted(remaining)}")
+        return [best[t] for t in targets], [meters[t] for t in targets]
+
+
+_road_graph_cache: Dict[str, RoadGraph] = {}
+
+
+def load_road_graph(path: str) -> RoadGraph:
+    """Return the process-wide road graph for `path`, loading it on first use."""
+    if path not in _road_graph_cache:
+        _road_graph_cache[path] = RoadGraph.load(path)
+    return _road_graph_cache[path]
+
+
+class LocalMapClient(MapClientProtocol):
+    """
+    Routes on a locally loaded road graph instead of the hosted ORS API.
+    Geocoding is delegated to `fallback` (typically a MapClient) because the
+    graph carries no addresses.
+    """
+
+    ROUTE_CACHE_SIZE = 64
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        fallback: Optional[MapClientProtocol] = None,
+        snap_km: float = 5.0,
+    ):
+        self.graph = graph
+        self.fallback = fallback
+        self.snap_km = snap_km
+        self._routes: "OrderedDict[Tuple[int, int], Tuple[float, float, List[int]]]" = OrderedDict()
+
+    def _node(self, location: Tuple[float, float]) -> int:
+        return self.graph.nearest_node(location[0], location[1], self.snap_km)
+
+    def _route(self, start: Tuple[float, float], end: Tuple[float, float]) -> Tuple[float, float, List[int]]:
+        """(seconds, meters, node path) between two points, memoized per node pair."""
+        key = (self._node(start), self._node(end))
+        if key in self._routes:
+            self._routes.move_to_end(key)
+            return self._routes[key]
+        result = self.graph.shortest_path(*key)
+        self._routes[key] = result
+        if len(self._routes) > self.ROUTE_CACHE_SIZE:
+            self._routes.popitem(last=False)
+        return result
+
+    def batch_address_to_coords(self, addresses: List[str]) -> List[Tuple[float, float]]:
+        if self.fallback is None:
+            raise MapAPIError("Local routing backend has no geocoder configured")
+        return self.fallback.batch_address_to_coords(addresses)
+
+    def durations_from_coords(self, locations: List[Tuple[float, float]]) -> List[float]:
+        if len(locations) < 2:
+            raise ValueError("At least two coordinates are required to compute durations.")
+        return [
+            self.matrix([locations[i]], [locations[i + 1]])["durations"][0][0]
+            for i in range(len(locations) - 1)
+        ]
+
+    def get_route_geometries(self, locations: List[Tuple[float, float]]) -> List[List[Tuple[float, float]]]:
+        if len(locations) < 2:
+            raise ValueError("At least two coordinates are required to compute routes.")
+        geometries = []
+        for i in range(len(locations) - 1):
+            _, _, path = self._route(locations[i], locations[i + 1])
+            geometries.append([[self.graph.lon[n], self.graph.lat[n]] for n in path])
+        return geometries
+
+    def get_total_distance(self, locations: List[Tuple[float, float]]) -> float:
+        return self.matrix([locations[0]], [locations[1]])["distances"][0][0]
+
+    def matrix(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> Dict[str, List[List[float]]]:
+        """
+        Many-to-many durations (hours) and distances (km). With a single
+        destination each cell is a memoized A* query, shared with the leg's
+        geometry; otherwise one Dijkstra search per source covers its row.
+        """
+        durations, distances = [], []
+        if len(destinations) == 1:
+            for source in sources:
+                seconds, meters, _ = self._route(source, destinations[0])
+                durations.append([seconds / 3600])
+                distances.append([meters / 1000])  # meters to km
+            return {"durations": durations, "distances": distances}
+
+        target_nodes = [self._node(d) for d in destinations]
+        for source in sources:
+            seconds, meters = self.graph.one_to_many(self._node(source), target_nodes)
+            durations.append([s / 3600 for s in seconds])
+            distances.append([m / 1000 for m in meters])
+        return {"durations": durations, "distances": distances}
+
+    def interpolate_along_route(self, route: List[Tuple[float, float]], current_km: float) -> Tuple[float, float]:
+        return interpolate_at_km(route, cumulative_km(route), current_km)
+
+    def reverse_geocode(self, lat: float, lon: float) -> str:
+        if self.fallback is None:
+            return "Unknown Location"
+        return self.fallback.reverse_geocode(lat, lon)
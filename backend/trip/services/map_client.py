@@ -1,12 +1,21 @@
-from typing import Protocol, Tuple, List
-import openrouteservice
-import requests
-from geopy.distance import geodesic
+from typing import Dict, Protocol, Set, Tuple, List
+
+from trip.services.circuit_breaker import get_breaker
+
+# openrouteservice, requests and geopy are imported where they are used so
+# that importing this module (and the URLconf) stays cheap at worker boot.
 
 # Exceptions
 class MapClientException(Exception): pass
 class MapAPIError(MapClientException): pass
 class InvalidAddressError(MapClientException): pass
+class ProviderUnavailableError(MapAPIError): pass
+
+ORS_BREAKER = "ors"
+NOMINATIM_BREAKER = "nominatim"
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_RETRY_TIMEOUT_SECONDS = 2.0
+DEFAULT_GEOCODE_TIMEOUT_SECONDS = 2.0
 
 
 # Interface / Protocol
@@ -27,6 +36,14 @@ class MapClientProtocol(Protocol):
         """Return total distance in kilometers between two points."""
         ...
 
+    def matrix(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> Dict[str, List[List[float]]]:
+        """Many-to-many {"durations": hours, "distances": km}, indexed [source][destination]."""
+        ...
+
     def interpolate_along_route(self, route: List[Tuple[float, float]], current_km: float) -> Tuple[float, float]:
         """Return coordinate (lon, lat) at a specific distance along the route."""
         ...
@@ -38,13 +55,63 @@ class MapClientProtocol(Protocol):
 
 # Concrete implementation
 class MapClient(MapClientProtocol):
-    def __init__(self, api_key: str):
-        self.client = openrouteservice.Client(key=api_key)
+    """
+    Client for the hosted providers. Build one per plan: after a provider's
+    first failure (timeout, 5xx, 429) the instance stops calling it, so a
+    brownout costs a plan one timeout per provider rather than one per call.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        retry_timeout: float = DEFAULT_RETRY_TIMEOUT_SECONDS,
+        geocode_timeout: float = DEFAULT_GEOCODE_TIMEOUT_SECONDS,
+    ):
+        import openrouteservice
+
+        self.timeout = timeout
+        self.geocode_timeout = geocode_timeout
+        # retry_timeout bounds the client's own 5xx retries; a 429 is not retried,
+        # it counts against the breaker like any other overload
+        self.client = openrouteservice.Client(
+            key=api_key,
+            timeout=timeout,
+            retry_timeout=retry_timeout,
+            retry_over_query_limit=False,
+        )
+        self.failed_providers: Set[str] = set()
+
+    def _call_ors(self, method: str, **kwargs):
+        """
+        Call an openrouteservice client method through the provider's circuit
+        breaker. Raises ProviderUnavailableError without calling while it is
+        open, or once the provider has already failed for this client.
+        """
+        if ORS_BREAKER in self.failed_providers:
+            raise ProviderUnavailableError("openrouteservice already failed for this plan")
+        breaker = get_breaker(ORS_BREAKER)
+        if not breaker.allow_request():
+            raise ProviderUnavailableError("openrouteservice is unavailable (circuit open)")
+        try:
+            result = getattr(self.client, method)(**kwargs)
+        except Exception as e:
+            status_code = getattr(e, "status", None)
+            if status_code is None or status_code >= 500 or status_code == 429:
+                breaker.record_failure()
+                self.failed_providers.add(ORS_BREAKER)
+            else:
+                # a client error (bad address, no route) still means the provider answered;
+                # it must also settle a half-open trial, or the circuit never closes again
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
 
     def _address_to_coords(self, address: str) -> Tuple[float, float]:
         """Internal method to resolve one address to coordinates."""
         try:
-            result = self.client.pelias_search(text=address)
+            result = self._call_ors("pelias_search", text=address)
             features = result.get("features", [])
             if not features:
                 raise InvalidAddressError(f"Address not found: '{address}'")
@@ -72,7 +139,8 @@ class MapClient(MapClientProtocol):
             raise ValueError("At least two coordinates are required to compute durations.")
 
         try:
-            matrix = self.client.distance_matrix(
+            matrix = self._call_ors(
+                "distance_matrix",
                 locations=locations,
                 profile='driving-car',
                 metrics=['duration'],
@@ -100,7 +168,8 @@ class MapClient(MapClientProtocol):
             for i in range(len(locations) - 1):
                 start = locations[i]
                 end = locations[i + 1]
-                route = self.client.directions(
+                route = self._call_ors(
+                    "directions",
                     coordinates=[start, end],
                     profile='driving-car',
                     format='geojson'
@@ -114,7 +183,8 @@ class MapClient(MapClientProtocol):
     
     def get_total_distance(self, locations: List[Tuple[float, float]]) -> float:
         try:
-            matrix = self.client.distance_matrix(
+            matrix = self._call_ors(
+                "distance_matrix",
                 locations=locations,
                 profile='driving-car',
                 metrics=['distance'],
@@ -124,8 +194,32 @@ class MapClient(MapClientProtocol):
             return distances_matrix[0][1] / 1000  # meters to km
         except Exception as e:
             raise MapAPIError(f"Failed to get distance: {e}")
+
+    def matrix(
+        self,
+        sources: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+    ) -> Dict[str, List[List[float]]]:
+        """Durations and distances for every source/destination pair in one request."""
+        try:
+            result = self._call_ors(
+                "distance_matrix",
+                locations=list(sources) + list(destinations),
+                profile='driving-car',
+                sources=list(range(len(sources))),
+                destinations=list(range(len(sources), len(sources) + len(destinations))),
+                metrics=['duration', 'distance'],
+                resolve_locations=False,
+            )
+            durations = [[d / 3600 for d in row] for row in result['durations']]
+            distances = [[d / 1000 for d in row] for row in result['distances']]
+        except Exception as e:
+            raise MapAPIError(f"Failed to get matrix: {e}")
+        return {"durations": durations, "distances": distances}
     
     def interpolate_along_route(self, route: List[Tuple[float, float]], current_km: float) -> Tuple[float, float]:
+        from geopy.distance import geodesic
+
         if not route:
             raise ValueError("Route is empty")
 
@@ -144,18 +238,30 @@ class MapClient(MapClientProtocol):
         return route[-1]  # fallback if over route
     
     def reverse_geocode(self, lat: float, lon: float) -> str:
+        import requests
+
+        if NOMINATIM_BREAKER in self.failed_providers:
+            return "Unknown Location"
+        breaker = get_breaker(NOMINATIM_BREAKER)
+        if not breaker.allow_request():
+            return "Unknown Location"
         try:
             response = requests.get(
                 "https://nominatim.openstreetmap.org/reverse",
                 params={"lat": lat, "lon": lon, "format": "json"},
-                headers={"User-Agent": "TripPlanner/1.0"}
+                headers={"User-Agent": "TripPlanner/1.0"},
+                timeout=self.geocode_timeout,
             )
+            response.raise_for_status()
             data = response.json().get("address", {})
-            city = data.get("city") or data.get("town") or data.get("village") or "Unknown"
-            state = data.get("state") or "Unknown"
-            return f"{city}, {state}"
         except Exception as e:
+            breaker.record_failure()
+            self.failed_providers.add(NOMINATIM_BREAKER)
             return "Unknown Location"
+        breaker.record_success()
+        city = data.get("city") or data.get("town") or data.get("village") or "Unknown"
+        state = data.get("state") or "Unknown"
+        return f"{city}, {state}"
 
 
 
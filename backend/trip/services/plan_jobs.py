@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework import status
+
+from trip.models import PlanJob, TripPlan
+from trip.services.plan_runner import run_plan, trip_plan_cutoff
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# notified whenever a job run by this process finishes, to wake long-polls early
+_job_finished = threading.Condition()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PLAN_JOB_WORKERS,
+                thread_name_prefix="plan-job",
+            )
+        return _executor
+
+
+def normalize_plan_input(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Canonical form of a plan input: addresses are case- and
+    whitespace-insensitive, cycle hours are compared to the minute.
+    Replannable plans are kept apart since only they return a plan_id.
+    """
+    return {
+        "current_location": " ".join(data["current_location"].split()).lower(),
+        "pickup_location": " ".join(data["pickup_location"].split()).lower(),
+        "dropoff_location": " ".join(data["dropoff_location"].split()).lower(),
+        "cycle_used_hours": round(float(data["cycle_used_hours"]), 2),
+        "replannable": bool(data.get("replannable", False)),
+    }
+
+
+def plan_input_key(data: Dict[str, Any]) -> str:
+    normalized = normalize_plan_input(data)
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def _needs_rerun(job: PlanJob) -> bool:
+    """
+    A duplicate submission re-runs a job only if it failed upstream (502),
+    succeeded on degraded map data, returned a plan_id whose stored plan has
+    expired, or its worker died before finishing it.
+    """
+    if job.status == PlanJob.STATUS_FAILED:
+        return job.http_status == status.HTTP_502_BAD_GATEWAY
+    if job.status == PlanJob.STATUS_SUCCEEDED:
+        result = job.result or {}
+        if result.get("degraded"):
+            return True
+        plan_id = result.get("plan_id")
+        return plan_id is not None and not TripPlan.objects.filter(
+            pk=plan_id, created_at__gte=trip_plan_cutoff()
+        ).exists()
+    return _is_stale(job)
+
+
+def _is_stale(job: PlanJob) -> bool:
+    """True for a pending/running job nobody has touched in PLAN_JOB_STALE_SECONDS."""
+    if job.status not in (PlanJob.STATUS_PENDING, PlanJob.STATUS_RUNNING):
+        return False
+    stale_before = timezone.now() - timedelta(seconds=settings.PLAN_JOB_STALE_SECONDS)
+    return job.updated_at < stale_before
+
+
+def _requeue(job: PlanJob) -> None:
+    """Reset `job` to pending and enqueue it, unless a concurrent caller already did."""
+    # conditional update so concurrent duplicates enqueue the rerun only once
+    requeued = PlanJob.objects.filter(
+        pk=job.pk, status=job.status, updated_at=job.updated_at
+    ).update(
+        status=PlanJob.STATUS_PENDING,
+        result=None,
+        http_status=None,
+        updated_at=timezone.now(),
+    )
+    if requeued:
+        _get_executor().submit(_execute_job, job.pk)
+    job.refresh_from_db()
+
+
+def submit_plan_job(data: Dict[str, Any]) -> PlanJob:
+    """
+    Return the job for this input, creating and enqueuing it if needed.
+    Finished jobs expire on the same TTL as stored plans.
+    """
+    PlanJob.objects.filter(
+        status__in=PlanJob.FINISHED_STATUSES, updated_at__lt=trip_plan_cutoff()
+    ).delete()
+    job, created = PlanJob.objects.get_or_create(
+        input_key=plan_input_key(data),
+        defaults={"input": dict(data)},
+    )
+    if created:
+        _get_executor().submit(_execute_job, job.pk)
+        return job
+
+    if _needs_rerun(job):
+        _requeue(job)
+    return job
+
+
+def _execute_job(job_id) -> None:
+    # runs in the executor, where an escaping exception would vanish into the Future:
+    # whatever goes wrong, try to leave the job in a terminal state
+    try:
+        _run_job(job_id)
+    except Exception as e:
+        logger.exception("Plan job %s failed", job_id)
+        _fail_job(job_id, f"Plan job failed: {e}")
+    finally:
+        connections.close_all()
+        with _job_finished:
+            _job_finished.notify_all()
+
+
+def _run_job(job_id) -> None:
+    claimed = PlanJob.objects.filter(
+        pk=job_id, status=PlanJob.STATUS_PENDING
+    ).update(status=PlanJob.STATUS_RUNNING, updated_at=timezone.now())
+    if not claimed:
+        return
+
+    job = PlanJob.objects.get(pk=job_id)
+    body, http_status = run_plan(job.input)
+    PlanJob.objects.filter(pk=job_id).update(
+        status=PlanJob.STATUS_SUCCEEDED if http_status == status.HTTP_200_OK else PlanJob.STATUS_FAILED,
+        result=body,
+        http_status=http_status,
+        updated_at=timezone.now(),
+    )
+
+
+def _fail_job(job_id, error: str) -> None:
+    try:
+        PlanJob.objects.filter(
+            pk=job_id, status__in=(PlanJob.STATUS_PENDING, PlanJob.STATUS_RUNNING)
+        ).update(
+            status=PlanJob.STATUS_FAILED,
+            result={"error": error},
+            http_status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            updated_at=timezone.now(),
+        )
+    except Exception:
+        # the database itself is failing; pollers re-enqueue the job once it goes stale
+        logger.exception("Could not mark plan job %s as failed", job_id)
+
+
+def wait_for_job(job_id, timeout: float) -> Optional[PlanJob]:
+    """
+    Long-poll: return the job once it has finished or `timeout` seconds
+    have passed, whichever comes first. Returns None for unknown ids.
+    A job left pending/running by a dead worker is re-enqueued.
+    """
+    deadline = time.monotonic() + max(0.0, timeout)
+    while True:
+        job = PlanJob.objects.filter(pk=job_id).first()
+        if job is not None and _is_stale(job):
+            _requeue(job)
+        remaining = deadline - time.monotonic()
+        if job is None or job.is_finished or remaining <= 0:
+            return job
+        # jobs run by another process only show up in the DB, so re-check periodically
+        with _job_finished:
+            _job_finished.wait(timeout=min(0.5, remaining))
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+
+from trip.models import TripPlan
+from trip.services.map_client import InvalidAddressError, MapAPIError, MapClient, MapClientProtocol
+from trip.services.poi_index import load_poi_index
+from trip.services.trip_planner import DutyLimitExceeded, TripPlanner
+from trip.services.trip_replanner import TripReplanner
+from trip.utils.geo import as_plain_list
+from trip.utils.time import quarters_to_hours
+
+
+def build_map_client() -> MapClientProtocol:
+    """
+    Map client for the configured ROUTING_BACKEND: "ors" (hosted API) or
+    "local" (road graph at ROAD_GRAPH_PATH, geocoding still via ORS).
+    With MAP_DEGRADED_MODE it is wrapped to fall back instead of failing
+    while a provider is down.
+    """
+    map_client = MapClient(
+        api_key=settings.OPENROUTESERVICE_API_KEY,
+        timeout=settings.MAP_REQUEST_TIMEOUT_SECONDS,
+        retry_timeout=settings.MAP_RETRY_TIMEOUT_SECONDS,
+        geocode_timeout=settings.NOMINATIM_TIMEOUT_SECONDS,
+    )
+    if settings.ROUTING_BACKEND == "local":
+        from trip.services.local_router import LocalMapClient, load_road_graph
+
+        map_client = LocalMapClient(
+            load_road_graph(settings.ROAD_GRAPH_PATH),
+            fallback=map_client,
+            snap_km=settings.ROAD_GRAPH_SNAP_KM,
+        )
+    if not settings.MAP_DEGRADED_MODE:
+        return map_client
+
+    from trip.services.degrading_map_client import DegradingMapClient
+
+    graph_path, snap_km = settings.ROAD_GRAPH_PATH, settings.ROAD_GRAPH_SNAP_KM
+
+    def load_estimator() -> MapClientProtocol:
+        from trip.services.local_router import LocalMapClient, load_road_graph
+
+        return LocalMapClient(load_road_graph(graph_path), snap_km=snap_km)
+
+    return DegradingMapClient(
+        map_client,
+        estimator=load_estimator if settings.ROUTING_BACKEND == "ors" and graph_path else None,
+        detour_factor=settings.MAP_DETOUR_FACTOR,
+        fallback_speed_kph=settings.MAP_FALLBACK_SPEED_KPH,
+    )
+
+
+def mark_degraded(body: Dict[str, Any], map_client: MapClientProtocol) -> None:
+    """Flag a plan built from fallback map data so clients can show it as approximate."""
+    reasons = getattr(map_client, "degraded_reasons", [])
+    body["degraded"] = bool(reasons)
+    if reasons:
+        body["degraded_reasons"] = list(reasons)
+
+
+def build_trip_planner(data: Dict[str, Any]) -> TripPlanner:
+    """Create a TripPlanner for validated `TripInputSerializer` data."""
+    map_client = build_map_client()
+    route_store = None
+    if settings.ROUTE_STORE_PATH:
+        from trip.services.route_store import load_route_store
+
+        route_store = load_route_store(settings.ROUTE_STORE_PATH)
+    return TripPlanner(
+        current_location=data['current_location'],
+        pickup_location=data['pickup_location'],
+        dropoff_location=data['dropoff_location'],
+        cycle_used_hours=data['cycle_used_hours'],
+        map_client=map_client,
+        poi_index=load_poi_index(settings.POI_DATASET_PATH),
+        poi_corridor_km=settings.POI_CORRIDOR_KM,
+        poi_lookback_km=settings.POI_LOOKBACK_KM,
+        route_store=route_store,
+    )
+
+
+def trip_plan_cutoff() -> datetime:
+    """Stored plans created before this are expired and can no longer be re-planned."""
+    return timezone.now() - timedelta(hours=settings.TRIP_PLAN_TTL_HOURS)
+
+
+def store_plan(planner: TripPlanner, data: Dict[str, Any]) -> TripPlan:
+    """
+    Persist what a re-plan needs to resume this trip without upstream calls,
+    dropping expired plans on the way.
+    """
+    TripPlan.objects.filter(created_at__lt=trip_plan_cutoff()).delete()
+    return TripPlan.objects.create(
+        input=dict(data),
+        coords=planner.coords,
+        drive_times={leg: quarters_to_hours(q) for leg, q in planner.drive_times.items()},
+        leg_distances=planner.leg_distances,
+        route_geometries=[as_plain_list(route) for route in planner.route_geometries],
+        route_km=[as_plain_list(km) for km in planner.route_indexes],
+    )
+
+
+def run_plan(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Plan a trip and return (body, http_status), mapping planner and map
+    errors the same way for synchronous requests and background jobs.
+    """
+    def plan() -> Dict[str, Any]:
+        planner = build_trip_planner(data)
+        body = planner.plan_trip()
+        mark_degraded(body, planner.map_client)
+        if data.get('replannable'):
+            body["plan_id"] = str(store_plan(planner, data).pk)
+        return body
+
+    return _respond(plan)
+
+
+def run_replan(plan: TripPlan, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Re-plan the rest of a stored trip from validated `ReplanInputSerializer` data.
+    """
+    def replan() -> Dict[str, Any]:
+        replanner = TripReplanner(
+            plan=plan,
+            position=(data['lon'], data['lat']),
+            current_time=data['current_time'],
+            driving_hours=data['driving_hours'],
+            duty_hours=data['duty_hours'],
+            cycle_used_hours=data['cycle_used_hours'],
+            km_since_refuel=data['km_since_refuel'],
+            map_client=build_map_client(),
+            leg=data.get('leg'),
+            on_route_km=settings.REPLAN_ON_ROUTE_KM,
+            poi_index=load_poi_index(settings.POI_DATASET_PATH),
+            poi_corridor_km=settings.POI_CORRIDOR_KM,
+            poi_lookback_km=settings.POI_LOOKBACK_KM,
+        )
+        body = replanner.plan_trip()
+        mark_degraded(body, replanner.map_client)
+        body["plan_id"] = str(plan.pk)
+        return body
+
+    return _respond(replan)
+
+
+def _respond(fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    try:
+        return fn(), status.HTTP_200_OK
+
+    except InvalidAddressError as e:
+        return {"error": str(e)}, status.HTTP_400_BAD_REQUEST
+
+    except DutyLimitExceeded as e:
+        return {"error": str(e)}, status.HTTP_400_BAD_REQUEST
+
+    except MapAPIError as e:
+        return {"error": f"Map service error: {e}"}, status.HTTP_502_BAD_GATEWAY
@@ -0,0 +1,156 @@
+import csv
+import math
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from trip.utils.geo import GridIndex, haversine_km
+
+# POI kinds a stop of each type may be snapped to
+REST_KINDS: FrozenSet[str] = frozenset({"truck_stop", "rest_area"})
+FUEL_KINDS: FrozenSet[str] = frozenset({"truck_stop", "fuel"})
+
+
+@dataclass(frozen=True)
+class POI:
+    name: str
+    kind: str
+    lon: float
+    lat: float
+
+    @property
+    def coords(self) -> Tuple[float, float]:
+        return (self.lon, self.lat)
+
+
+@dataclass(frozen=True)
+class CorridorStop:
+    poi: POI
+    km: float          # position along the route where the POI is closest
+    offset_km: float   # straight-line distance from the route to the POI
+
+
+class RouteCorridor:
+    """
+    POIs lying within the corridor of one route, sorted by their position
+    along the route so a km window can be answered with two bisects.
+    """
+
+    def __init__(self, stops: List[CorridorStop]):
+        self.stops = sorted(stops, key=lambda s: s.km)
+        self._kms = [s.km for s in self.stops]
+
+    def __len__(self) -> int:
+        return len(self.stops)
+
+    def best_stop(self, kinds: FrozenSet[str], km_start: float, km_end: float) -> Optional[CorridorStop]:
+        """
+        Return the stop of one of `kinds` that lies furthest along the route
+        inside [km_start, km_end]; ties go to the stop closest to the road.
+        """
+        lo = bisect_left(self._kms, km_start)
+        hi = bisect_right(self._kms, km_end)
+        best = None
+        for stop in self.stops[lo:hi]:
+            if stop.poi.kind not in kinds:
+                continue
+            if best is None or (stop.km, -stop.offset_km) >= (best.km, -best.offset_km):
+                best = stop
+        return best
+
+
+class POIIndex:
+    """
+    Spatial index over a locally loaded dataset of truck stops and fuel
+    stations. Build a `RouteCorridor` once per leg, then query it per stop.
+    """
+
+    def __init__(self, pois: Sequence[POI], cell_deg: float = 0.25):
+        self.grid: GridIndex[POI] = GridIndex.from_points(
+            ((p.lon, p.lat, p) for p in pois), cell_deg=cell_deg
+        )
+
+    def __len__(self) -> int:
+        return len(self.grid)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "POIIndex":
+        """
+        Load POIs from a CSV file with `name,kind,lon,lat` columns.
+        """
+        pois = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                pois.append(
+                    POI(
+                        name=row["name"].strip(),
+                        kind=row["kind"].strip().lower(),
+                        lon=float(row["lon"]),
+                        lat=float(row["lat"]),
+                    )
+                )
+        return cls(pois)
+
+    def corridor(
+        self,
+        route: Sequence[Sequence[float]],
+        cum_km: Sequence[float],
+        width_km: float,
+    ) -> RouteCorridor:
+        """
+        Collect every POI within `width_km` of a route vertex, keyed to the
+        cumulative km of the closest vertex. Route vertices are bucketed on a
+        grid about `width_km` wide, so each POI near the route is measured
+        only against the vertices in its own neighbourhood.
+        """
+        vertices: GridIndex[int] = GridIndex.from_points(
+            ((point[0], point[1], i) for i, point in enumerate(route)),
+            cell_deg=max(width_km / 111.0, 1e-3),
+        )
+
+        # POI cells within reach of the route, gathered once per route cell
+        poi_cells = set()
+        route_cells = set()
+        for point in route:
+            cell = self.grid.cell_of(point[0], point[1])
+            if cell not in route_cells:
+                route_cells.add(cell)
+                poi_cells.update(self.grid.neighbour_cells(point[0], point[1], width_km))
+
+        nearest: Dict[POI, Tuple[float, float]] = {}
+        for cell in poi_cells:
+            for poi_lon, poi_lat, poi in self.grid.cell_items(cell):
+                # closest vertex by a local flat projection; only it gets a haversine
+                kx = 111.320 * math.cos(math.radians(poi_lat))
+                best_sq, best_i = math.inf, -1
+                for vertex_cell in vertices.neighbour_cells(poi_lon, poi_lat, width_km):
+                    for lon, lat, i in vertices.cell_items(vertex_cell):
+                        dx = (lon - poi_lon) * kx
+                        dy = (lat - poi_lat) * 110.574
+                        dist_sq = dx * dx + dy * dy
+                        if dist_sq < best_sq:
+                            best_sq, best_i = dist_sq, i
+                if best_i < 0:
+                    continue
+                offset = haversine_km((poi_lon, poi_lat), (route[best_i][0], route[best_i][1]))
+                if offset <= width_km:
+                    nearest[poi] = (cum_km[best_i], offset)
+
+        return RouteCorridor(
+            [CorridorStop(poi=poi, km=km, offset_km=offset) for poi, (km, offset) in nearest.items()]
+        )
+
+
+_poi_index_cache: Dict[str, POIIndex] = {}
+
+
+def load_poi_index(path: str) -> Optional[POIIndex]:
+    """
+    Return the process-wide POI index for `path`, loading it on first use.
+    An empty path means POI snapping is disabled.
+    """
+    if not path:
+        return None
+    if path not in _poi_index_cache:
+        _poi_index_cache[path] = POIIndex.from_csv(path)
+    return _poi_index_cache[path]
@@ -0,0 +1,96 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Plan-Profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ID_HEADER = "X-Plan-Profile-Id"
+
+# Plan stages and the functions whose cumulative time makes them up,
+# as (path fragment, function name) pairs.
+STAGE_FUNCTIONS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "geocode": (("trip", "batch_address_to_coords"),),
+    "matrix": (
+        ("trip", "durations_from_coords"),
+        ("trip", "get_total_distance"),
+        ("trip", "matrix"),
+    ),
+    "directions": (("trip", "get_route_geometries"),),
+    "hos_loop": (("trip", "_process_leg"),),
+    "reverse_geocode": (("trip", "reverse_geocode"),),
+    "day_slicing": (("trip", "_slice_by_day"),),
+    "serialization": (("rest_framework", "rendered_content"),),
+}
+
+
+def profiling_requested(request) -> bool:
+    """True when the request asks for a profile via header or query flag."""
+    flag = request.headers.get(PROFILE_HEADER) or request.GET.get(PROFILE_QUERY_PARAM) or ""
+    return flag.lower() in ("1", "true", "yes")
+
+
+def _stage_of(key: Tuple[str, int, str]) -> str:
+    filename, _, funcname = key
+    for stage, functions in STAGE_FUNCTIONS.items():
+        for fragment, name in functions:
+            if funcname == name and fragment in filename.split(os.sep):
+                return stage
+    return ""
+
+
+def stage_breakdown(stats: pstats.Stats) -> Dict[str, float]:
+    """
+    Milliseconds spent per plan stage. Only the outermost call of a stage is
+    counted (e.g. a fallback client's reverse_geocode inside another one), and
+    reverse geocoding is taken out of the HOS loop that triggers it.
+    """
+    stages = {stage: 0.0 for stage in STAGE_FUNCTIONS}
+    for key, (_, _, _, cumulative, callers) in stats.stats.items():
+        stage = _stage_of(key)
+        if not stage:
+            continue
+        if callers and all(_stage_of(caller) == stage for caller in callers):
+            continue
+        stages[stage] += cumulative * 1000
+    stages["hos_loop"] = max(0.0, stages["hos_loop"] - stages["reverse_geocode"])
+    return {stage: round(ms, 3) for stage, ms in stages.items()}
+
+
+def profile_call(fn: Callable[[], Any], profile_dir: str) -> Tuple[Any, Optional[str]]:
+    """
+    Run `fn` under cProfile and store the pstats dump plus a JSON stage
+    breakdown in `profile_dir`. Returns (fn's result, profile id); the id is
+    None if the profile could not be written, which never fails the call.
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    result = profiler.runcall(fn)
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    stats = pstats.Stats(profiler)
+    try:
+        os.makedirs(profile_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(profile_dir, f"{profile_id}.prof"))
+        with open(os.path.join(profile_dir, f"{profile_id}.json"), "w") as f:
+            json.dump(
+                {
+                    "id": profile_id,
+                    "wall_ms": round(wall_ms, 3),
+                    "stages_ms": stage_breakdown(stats),
+                    "pstats": f"{profile_id}.prof",
+                },
+                f,
+                indent=2,
+            )
+    except OSError as e:
+        logger.warning("Could not write plan profile to %r: %s", profile_dir, e)
+        return result, None
+    return result, profile_id
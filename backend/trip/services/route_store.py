@@ -0,0 +1,147 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class StoredRoute(NamedTuple):
+    coords: np.ndarray   # (n, 2) float64 lon/lat, read-only view into the store
+    cum_km: np.ndarray   # (n,) float64 cumulative-km index, read-only view
+
+
+class RouteGeometryStore:
+    """
+    Append-only, memory-mapped file of leg geometries and their cumulative-km
+    indexes, shared by every worker process on the host.
+
+    Layout: an 8-byte magic, then records of
+    [16-byte leg key][uint64 vertex count n][n*2 float64 lon/lat][n float64 km].
+    All fields are 8-byte aligned so records are read as NumPy views without
+    copying. Writers append whole records under an exclusive flock, first
+    cutting off any partial record a crashed writer left behind; readers
+    never lock and ignore a trailing record that is not fully written yet.
+    """
+
+    MAGIC = b"DPROUTE1"
+    RECORD_HEADER = struct.Struct("<16sQ")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[bytes, Tuple[int, int]] = {}  # key -> (data offset, vertex count)
+        self._scanned = len(self.MAGIC)
+        self._mm: Optional[mmap.mmap] = None
+        self._ensure_file()
+
+    @staticmethod
+    def leg_key(origin: Sequence[float], destination: Sequence[float]) -> bytes:
+        text = f"{origin[0]:.6f},{origin[1]:.6f};{destination[0]:.6f},{destination[1]:.6f}"
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def get(self, origin: Sequence[float], destination: Sequence[float]) -> Optional[StoredRoute]:
+        key = self.leg_key(origin, destination)
+        with self._lock:
+            if key not in self._records:
+                self._refresh()
+            if key not in self._records:
+                return None
+            return self._view(key)
+
+    def put(
+        self,
+        origin: Sequence[float],
+        destination: Sequence[float],
+        route: Sequence[Sequence[float]],
+        cum_km: Sequence[float],
+    ) -> StoredRoute:
+        key = self.leg_key(origin, destination)
+        coords = np.ascontiguousarray(route, dtype="<f8").reshape(-1, 2)
+        km = np.ascontiguousarray(cum_km, dtype="<f8")
+        record = self.RECORD_HEADER.pack(key, len(coords)) + coords.tobytes() + km.tobytes()
+
+        with self._lock:
+            with open(self.path, "r+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # another worker may have stored this leg while we were routing
+                    self._refresh()
+                    if key not in self._records:
+                        # drop a partial record left by a writer that died mid-append,
+                        # or every later record would be read from the wrong offset
+                        f.truncate(self._scanned)
+                        f.seek(self._scanned)
+                        f.write(record)
+                        f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            self._refresh()
+            return self._view(key)
+
+    def _ensure_file(self) -> None:
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if f.tell() == 0:
+                    f.write(self.MAGIC)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """
+        Index the new, complete records and map the file up to their end.
+        Headers are read with pread rather than through a mapping: a writer
+        may truncate a partial tail at any time, and touching a mapped page
+        past the new end of file would kill the process with SIGBUS.
+        """
+        size = os.path.getsize(self.path)
+        if size <= self._scanned:
+            return
+        header_size = self.RECORD_HEADER.size
+        with open(self.path, "rb") as f:
+            fd = f.fileno()
+            if self._mm is None and os.pread(fd, len(self.MAGIC), 0) != self.MAGIC:
+                raise ValueError(f"{self.path} is not a route geometry store")
+
+            offset = self._scanned
+            while offset + header_size <= size:
+                header = os.pread(fd, header_size, offset)
+                if len(header) < header_size:
+                    break
+                key, count = self.RECORD_HEADER.unpack(header)
+                end = offset + header_size + count * 3 * 8
+                if end > size:
+                    break
+                self._records.setdefault(key, (offset + header_size, count))
+                offset = end
+
+            if offset > self._scanned:
+                # complete records are never truncated, so mapping only them is safe;
+                # views handed out earlier keep the previous mapping alive
+                self._mm = mmap.mmap(fd, offset, access=mmap.ACCESS_READ)
+                self._scanned = offset
+
+    def _view(self, key: bytes) -> StoredRoute:
+        offset, count = self._records[key]
+        coords = np.frombuffer(self._mm, dtype="<f8", count=count * 2, offset=offset)
+        cum_km = np.frombuffer(self._mm, dtype="<f8", count=count, offset=offset + count * 16)
+        return StoredRoute(coords=coords.reshape(count, 2), cum_km=cum_km)
+
+
+_route_store_cache: Dict[str, RouteGeometryStore] = {}
+
+
+def load_route_store(path: str) -> Optional[RouteGeometryStore]:
+    """
+    Return the process-wide route store for `path`, opening it on first use.
+    An empty path means geometries are not shared.
+    """
+    if not path:
+        return None
+    if path not in _route_store_cache:
+        _route_store_cache[path] = RouteGeometryStore(path)
+    return _route_store_cache[path]
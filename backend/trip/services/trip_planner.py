@@ -1,9 +1,19 @@
 from functools import cached_property
-from typing import Tuple, Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Tuple, Dict, List, Any, Optional, FrozenSet
 from dataclasses import dataclass
 
 from trip.services.map_client import MapClientProtocol
-from trip.utils.time import round_down_to_15min, round_up_to_15min
+from trip.services.poi_index import FUEL_KINDS, REST_KINDS, CorridorStop, POIIndex, RouteCorridor
+from trip.utils.geo import as_plain_list, cumulative_km, interpolate_at_km
+from trip.utils.time import (
+    QUARTERS_PER_HOUR,
+    hours_to_quarters_down,
+    hours_to_quarters_up,
+    quarters_to_hours,
+)
+
+if TYPE_CHECKING:
+    from trip.services.route_store import RouteGeometryStore, StoredRoute
 
 MAX_DRIVE_HOURS_PER_DAY = 11
 MAX_DUTY_HOURS_PER_DAY = 14
@@ -13,52 +23,77 @@ FUEL_MILES = 1000
 KM_PER_MILE = 1.60934
 FUEL_DISTANCE_KM = FUEL_MILES * KM_PER_MILE  # ≈1609.34 km
 REFILL_DURATION_HOURS = 0.5
+POI_CORRIDOR_KM = 5.0       # max distance a stop may sit off the route
+POI_LOOKBACK_KM = 80.0      # how far before the limit a stop may be taken
+
+# The planner core runs on an integer quarter-hour grid
+MAX_DRIVE_QUARTERS_PER_DAY = MAX_DRIVE_HOURS_PER_DAY * QUARTERS_PER_HOUR
+MAX_DUTY_QUARTERS_PER_DAY = MAX_DUTY_HOURS_PER_DAY * QUARTERS_PER_HOUR
+DUTY_LIMIT_REST_QUARTERS = DUTY_LIMIT_REST_DURATION * QUARTERS_PER_HOUR
+REFILL_DURATION_QUARTERS = hours_to_quarters_up(REFILL_DURATION_HOURS)
+DAY_QUARTERS = 24 * QUARTERS_PER_HOUR
 
 class DutyLimitExceeded(Exception):
     pass
 
 @dataclass
 class Leg:
+    """
+    One driving leg. drive_time, load_time and remain_drive are integer
+    quarter-hours; distances are km.
+    """
     name: str
-    drive_time: float
+    drive_time: int
     distance: float
-    load_time: float
+    load_time: int
     location: str
     info: str
     route: List[Tuple[float, float]]
 
-    remain_drive: float = 0.0
+    remain_drive: int = 0
     km_covered: float = 0.0
     km_covered_no_refill = 0.0
+    corridor: Optional[RouteCorridor] = None
+    route_km: Optional[List[float]] = None
 
     def __post_init__(self):
         self.reset_tracking()
 
+    @property
+    def cumulative_km(self) -> List[float]:
+        if self.route_km is None:
+            self.route_km = cumulative_km(self.route)
+        return self.route_km
+
     def reset_tracking(self):
         self.remain_drive = self.drive_time
         self.km_covered = 0.0
 
-    def compute_allowed_drive(self, driving_time: float, duty_time: float) -> float:
-        max_drive = MAX_DRIVE_HOURS_PER_DAY - driving_time
-        max_duty = MAX_DUTY_HOURS_PER_DAY - duty_time
+    def compute_allowed_drive(self, driving_time: int, duty_time: int) -> int:
+        max_drive = MAX_DRIVE_QUARTERS_PER_DAY - driving_time
+        max_duty = MAX_DUTY_QUARTERS_PER_DAY - duty_time
         return min(max_drive, max_duty, self.remain_drive)
     
-    def compute_allowed_drive_to_refill(self) -> float:
+    def compute_allowed_drive_to_refill(self) -> int:
         # distance remain to get to FUEL_DISTANCE_KM without refill
         distance = FUEL_DISTANCE_KM - self.km_covered_no_refill
-        raw_time = self.drive_time_for_distance(distance)
-        return round_down_to_15min(raw_time)
+        return self.quarters_for_distance(distance)
 
-    def drive_distance_for_allowed_drive(self, allowed_drive: float) -> float:
+    def drive_distance_for_allowed_drive(self, allowed_drive: int) -> float:
         return (allowed_drive / self.drive_time) * self.distance
     
     def drive_time_for_distance(self, distance: float) -> float:
+        """Hours needed to drive `distance` km on this leg."""
         if self.distance == 0:
             return 0.0
-        return (distance / self.distance) * self.drive_time
+        return (distance / self.distance) * quarters_to_hours(self.drive_time)
+
+    def quarters_for_distance(self, distance: float) -> int:
+        """Whole quarter-hours of driving that stay within `distance` km."""
+        return hours_to_quarters_down(self.drive_time_for_distance(distance))
 
-    def consume_allowed_drive(self, allowed_drive: float):
-        self.remain_drive = max(0.0, self.remain_drive - allowed_drive)
+    def consume_allowed_drive(self, allowed_drive: int):
+        self.remain_drive = max(0, self.remain_drive - allowed_drive)
         drive_distance = self.drive_distance_for_allowed_drive(allowed_drive)
         self.km_covered += drive_distance
         self.km_covered_no_refill += drive_distance
@@ -78,6 +113,10 @@ class TripPlanner:
         cycle_used_hours: float,
         map_client: MapClientProtocol,
         start_time: Optional[float] = 5,
+        poi_index: Optional[POIIndex] = None,
+        poi_corridor_km: float = POI_CORRIDOR_KM,
+        poi_lookback_km: float = POI_LOOKBACK_KM,
+        route_store: Optional["RouteGeometryStore"] = None,
     ):
         self.current_location = current_location
         self.pickup_location = pickup_location
@@ -85,8 +124,12 @@ class TripPlanner:
         self.cycle_used_hours = cycle_used_hours
         self.map_client = map_client
         self.start_time = start_time
-        self.loading_time = round_up_to_15min(1)
-        self.unloading_time = round_up_to_15min(1)
+        self.poi_index = poi_index
+        self.poi_corridor_km = poi_corridor_km
+        self.poi_lookback_km = poi_lookback_km
+        self.route_store = route_store
+        self.loading_time = hours_to_quarters_up(1)
+        self.unloading_time = hours_to_quarters_up(1)
 
     @cached_property
     def coords(self) -> Dict[str, Tuple[float, float]]:
@@ -100,39 +143,80 @@ class TripPlanner:
         return [self.coords["current"], self.coords["pickup"], self.coords["dropoff"]]
 
     @cached_property
-    def drive_times(self) -> Dict[str, float]:
-        durations = self.map_client.durations_from_coords(self.coord_list)
+    def leg_matrix(self) -> Dict[str, List[float]]:
+        """Duration (hours) and distance (km) of each leg, one matrix query per leg."""
+        durations, distances = [], []
+        for start, end in zip(self.coord_list, self.coord_list[1:]):
+            cell = self.map_client.matrix([start], [end])
+            durations.append(cell["durations"][0][0])
+            distances.append(cell["distances"][0][0])
+        return {"durations": durations, "distances": distances}
+
+    @cached_property
+    def drive_times(self) -> Dict[str, int]:
+        """Drive time of each leg in whole quarter-hours, rounded up."""
+        durations = self.leg_matrix["durations"]
         return {
-            "leg1": round_up_to_15min(durations[0]),
-            "leg2": round_up_to_15min(durations[1]),
+            "leg1": hours_to_quarters_up(durations[0]),
+            "leg2": hours_to_quarters_up(durations[1]),
         }
 
     @cached_property
     def leg_distances(self) -> Dict[str, float]:
-        return {
-            "leg1": self.map_client.get_total_distance(
-                [self.coord_list[0], self.coord_list[1]]
-            ),
-            "leg2": self.map_client.get_total_distance(
-                [self.coord_list[1], self.coord_list[2]]
-            ),
-        }
+        distances = self.leg_matrix["distances"]
+        return {"leg1": distances[0], "leg2": distances[1]}
+
+    @cached_property
+    def stored_routes(self) -> Optional[List["StoredRoute"]]:
+        """
+        Leg geometries read zero-copy from the shared route store; legs not
+        stored yet are fetched once and appended for every other worker.
+        Fallback geometries from a degraded map client are never stored.
+        """
+        if self.route_store is None:
+            return None
+        from trip.services.route_store import StoredRoute
+
+        routes = []
+        for start, end in zip(self.coord_list, self.coord_list[1:]):
+            stored = self.route_store.get(start, end)
+            if stored is None:
+                geometry = self.map_client.get_route_geometries([start, end])[0]
+                if getattr(self.map_client, "degraded", False):
+                    stored = StoredRoute(coords=geometry, cum_km=cumulative_km(geometry))
+                else:
+                    stored = self.route_store.put(start, end, geometry, cumulative_km(geometry))
+            routes.append(stored)
+        return routes
 
     @cached_property
     def route_geometries(self) -> List[List[Tuple[float, float]]]:
+        if self.stored_routes is not None:
+            return [route.coords for route in self.stored_routes]
         return self.map_client.get_route_geometries(self.coord_list)
 
+    @cached_property
+    def route_indexes(self) -> List[List[float]]:
+        """Cumulative-km index of each leg geometry."""
+        if self.stored_routes is not None:
+            return [route.cum_km for route in self.stored_routes]
+        return [cumulative_km(route) for route in self.route_geometries]
+
     def plan_trip(self) -> Dict[str, Any]:
         self._enforce_cycle_limit()
         rests, log_sheets = self._build_plan_trip()
-        return {"rests": rests, "log_sheets": log_sheets, "routes": self.route_geometries}
+        return {
+            "rests": rests,
+            "log_sheets": log_sheets,
+            "routes": [as_plain_list(route) for route in self.route_geometries],
+        }
     
     def _enforce_cycle_limit(self) -> None:
         """
         Raises DutyLimitExceeded if the sum of
         previous cycle hours + this trip's duty would go over MAX_CYCLE_HOURS.
         """
-        total_duty = (
+        total_duty = quarters_to_hours(
             self.drive_times["leg1"]
           + self.drive_times["leg2"]
           + self.loading_time
@@ -146,8 +230,8 @@ class TripPlanner:
 
 
 
-    def _build_plan_trip(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-        legs = [
+    def _build_legs(self) -> List[Leg]:
+        return [
             Leg(
                 "leg1",
                 self.drive_times["leg1"],
@@ -156,6 +240,7 @@ class TripPlanner:
                 self.pickup_location,
                 "Pickup",
                 self.route_geometries[0],
+                route_km=self.route_indexes[0],
             ),
             Leg(
                 "leg2",
@@ -165,14 +250,30 @@ class TripPlanner:
                 self.dropoff_location,
                 "Dropoff",
                 self.route_geometries[1],
+                route_km=self.route_indexes[1],
             ),
         ]
 
+    def _build_plan_trip(
+        self,
+        driving_time: int = 0,
+        duty_time: int = 0,
+        km_covered_no_refill: float = 0.0,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Runs the HOS loop over the legs. Times (including activity and remark
+        start/end) are quarter-hours until `_slice_by_day` converts them.
+        """
+        legs = self._build_legs()
+        if self.poi_index is not None:
+            for leg in legs:
+                leg.corridor = self.poi_index.corridor(
+                    leg.route, leg.cumulative_km, self.poi_corridor_km
+                )
+
         all_activities: List[Dict[str, Any]] = []
         all_remarks: List[Dict[str, Any]] = []
-        current_time = self.start_time
-        driving_time = duty_time = 0.0
-        km_covered_no_refill = 0.0
+        current_time = hours_to_quarters_up(self.start_time)
         # ── add initial Off Duty if trip doesn't start at hour 0 ──
         current_time = self._add_start_off_duty(all_activities, current_time)
 
@@ -193,15 +294,15 @@ class TripPlanner:
     def _add_start_off_duty(
         self,
         all_activities: List[Dict[str, Any]],
-        current_time: float
-    ) -> float:
+        current_time: int
+    ) -> int:
         """
         Adds an initial 'Off Duty' activity if the trip doesn't start at hour 0.
         Returns updated current_time (unchanged if no off duty was added).
         """
         if current_time > 0:
             all_activities.append({
-                "start": 0.0,
+                "start": 0,
                 "end": current_time,
                 "status": "Off Duty"
             })
@@ -210,11 +311,11 @@ class TripPlanner:
     def _process_leg(
         self,
         leg: Leg,
-        current_time: float,
-        driving_time: float,
-        duty_time: float,
+        current_time: int,
+        driving_time: int,
+        duty_time: int,
         km_covered_no_refill: float, 
-    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], float, float, float]:
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int, int, int, float]:
         activities: List[Dict[str, Any]] = []
         remarks: List[Dict[str, Any]] = []
         leg.reset_tracking()
@@ -229,10 +330,26 @@ class TripPlanner:
                 continue
             allowed_drive_to_refill = leg.compute_allowed_drive_to_refill()
             if allowed_drive > allowed_drive_to_refill:
+                stop = self._find_stop(leg, allowed_drive_to_refill, FUEL_KINDS)
+                if stop is not None:
+                    current_time, driving_time, duty_time = self._drive_to_stop(
+                        leg, stop, current_time, driving_time, duty_time, activities
+                    )
                 current_time, duty_time = self._handle_km_covered_no_refill(
-                    leg, current_time,duty_time, remarks, activities
+                    leg, current_time,duty_time, remarks, activities, stop
                 )
                 continue
+            if allowed_drive < leg.remain_drive:
+                # the clock runs out on this segment: rest at a truck stop if one is in reach
+                stop = self._find_stop(leg, allowed_drive, REST_KINDS)
+                if stop is not None:
+                    current_time, driving_time, duty_time = self._drive_to_stop(
+                        leg, stop, current_time, driving_time, duty_time, activities
+                    )
+                    current_time, driving_time, duty_time = self._handle_off_duty_reset(
+                        leg, current_time, remarks, activities, stop
+                    )
+                    continue
             current_time, driving_time, duty_time = self._handle_drive_segment(
                 leg, current_time, allowed_drive, driving_time, duty_time, activities
             )
@@ -246,13 +363,13 @@ class TripPlanner:
     def _handle_off_duty_reset(
         self,
         leg: Leg,
-        current_time: float,
+        current_time: int,
         remarks: List[Dict[str, Any]],
         activities: List[Dict[str, Any]],
-    ) -> Tuple[float, float, float]:
-        end = current_time + DUTY_LIMIT_REST_DURATION
-        coord = self.map_client.interpolate_along_route(leg.route, leg.km_covered)
-        loc = self.map_client.reverse_geocode(coord[1], coord[0])
+        stop: Optional[CorridorStop] = None,
+    ) -> Tuple[int, int, int]:
+        end = current_time + DUTY_LIMIT_REST_QUARTERS
+        coord, loc = self._stop_location(leg, stop)
         activities.append({"start": current_time, "end": end, "status": "Off Duty"})
         remarks.append(
             {
@@ -263,19 +380,19 @@ class TripPlanner:
                 "coords": coord
             }
         )
-        return end, 0.0, 0.0
+        return end, 0, 0
     
     def _handle_km_covered_no_refill(
         self,
         leg: Leg,
-        current_time: float,
-        duty_time: float,
+        current_time: int,
+        duty_time: int,
         remarks: List[Dict[str, Any]],
         activities: List[Dict[str, Any]],
-    ) -> Tuple[float, float]:
-        end = current_time + REFILL_DURATION_HOURS
-        coord = self.map_client.interpolate_along_route(leg.route, leg.km_covered)
-        loc = self.map_client.reverse_geocode(coord[1], coord[0])
+        stop: Optional[CorridorStop] = None,
+    ) -> Tuple[int, int]:
+        end = current_time + REFILL_DURATION_QUARTERS
+        coord, loc = self._stop_location(leg, stop)
         activities.append({"start": current_time, "end": end, "status": "On Duty"})
         remarks.append(
             {
@@ -286,19 +403,62 @@ class TripPlanner:
                 "coords": coord
             }
         )
-        duty_time += REFILL_DURATION_HOURS
+        duty_time += REFILL_DURATION_QUARTERS
         leg.reset_km_covered_no_refill()
         return end, duty_time
 
+    def _stop_location(
+        self, leg: Leg, stop: Optional[CorridorStop]
+    ) -> Tuple[Tuple[float, float], str]:
+        """
+        Coordinates and readable name of a stop: the snapped POI when there is
+        one, otherwise the interpolated point where the truck is.
+        """
+        if stop is not None:
+            return stop.poi.coords, stop.poi.name
+        coord = interpolate_at_km(leg.route, leg.cumulative_km, leg.km_covered)
+        return coord, self.map_client.reverse_geocode(coord[1], coord[0])
+
+    def _find_stop(
+        self, leg: Leg, max_drive: int, kinds: FrozenSet[str]
+    ) -> Optional[CorridorStop]:
+        """
+        Best POI of `kinds` ahead of the truck that can be reached within
+        `max_drive` quarter-hours, at most `poi_lookback_km` before the limit.
+        """
+        if leg.corridor is None or not leg.corridor:
+            return None
+        km_end = leg.km_covered + leg.drive_distance_for_allowed_drive(max(0, max_drive))
+        km_start = max(leg.km_covered, km_end - self.poi_lookback_km)
+        return leg.corridor.best_stop(kinds, km_start, km_end)
+
+    def _drive_to_stop(
+        self,
+        leg: Leg,
+        stop: CorridorStop,
+        current_time: int,
+        driving_time: int,
+        duty_time: int,
+        activities: List[Dict[str, Any]],
+    ) -> Tuple[int, int, int]:
+        # round up so the truck reaches the POI; stop.km lies inside the window
+        # found for the allowed quarters, so this never exceeds them
+        drive = hours_to_quarters_up(leg.drive_time_for_distance(stop.km - leg.km_covered))
+        if drive <= 0:
+            return current_time, driving_time, duty_time
+        return self._handle_drive_segment(
+            leg, current_time, drive, driving_time, duty_time, activities
+        )
+
     def _handle_drive_segment(
         self,
         leg: Leg,
-        current_time: float,
-        allowed_drive: float,
-        driving_time: float,
-        duty_time: float,
+        current_time: int,
+        allowed_drive: int,
+        driving_time: int,
+        duty_time: int,
         activities: List[Dict[str, Any]],
-    ) -> Tuple[float, float, float]:
+    ) -> Tuple[int, int, int]:
         end = current_time + allowed_drive
         activities.append({"start": current_time, "end": end, "status": "Driving"})
         driving_time += allowed_drive
@@ -309,14 +469,14 @@ class TripPlanner:
     def _handle_leg_drive_time_completed(
         self,
         leg: Leg,
-        current_time: float,
-        driving_time: float,
-        duty_time: float,
+        current_time: int,
+        driving_time: int,
+        duty_time: int,
         remarks: List[Dict[str, Any]],
         activities: List[Dict[str, Any]],
-    ) -> Tuple[float, float, float]:
+    ) -> Tuple[int, int, int]:
         # enforce duty limit before load/unload
-        if duty_time + leg.load_time > MAX_DUTY_HOURS_PER_DAY:
+        if duty_time + leg.load_time > MAX_DUTY_QUARTERS_PER_DAY:
             current_time, driving_time, duty_time = self._handle_off_duty_reset(
                 leg, current_time, remarks, activities
             )
@@ -337,13 +497,13 @@ class TripPlanner:
     def _add_end_of_day_rest(
         self,
         all_activities: List[Dict[str, Any]],
-        current_time: float
-    ) -> float:
+        current_time: int
+    ) -> int:
         """
         Appends a single 'Off Duty' activity from current_time until next midnight.
         Returns the updated current_time at midnight.
         """
-        end = (int(current_time / 24) + 1) * 24
+        end = (current_time // DAY_QUARTERS + 1) * DAY_QUARTERS
         if current_time < end:
             all_activities.append({
                 "start": current_time,
@@ -387,11 +547,15 @@ class TripPlanner:
     def _slice_by_day(
         self, activities: List[Dict[str, Any]], remarks: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
+        """
+        Cuts quarter-hour activities and remarks into one log sheet per day,
+        converting times back to float hours.
+        """
         log_sheets: List[Dict[str, Any]] = []
         day = 0
         while True:
-            day_start = 24 * day
-            day_end = day_start + 24
+            day_start = DAY_QUARTERS * day
+            day_end = day_start + DAY_QUARTERS
             day_acts = [
                 a for a in activities if a["start"] < day_end and a["end"] > day_start
             ]
@@ -403,8 +567,8 @@ class TripPlanner:
             ]
 
             sheet_acts = []
-            by_status: Dict[str, float] = {}
-            total_minutes = 0.0
+            by_status: Dict[str, int] = {}
+            total_quarters = 0
 
             for a in day_acts:
                 start = max(a["start"], day_start)
@@ -412,18 +576,18 @@ class TripPlanner:
                 duration = end - start
                 sheet_acts.append(
                     {
-                        "start": start - day_start,
-                        "end": end - day_start,
+                        "start": quarters_to_hours(start - day_start),
+                        "end": quarters_to_hours(end - day_start),
                         "status": a["status"],
                     }
                 )
-                by_status[a["status"]] = by_status.get(a["status"], 0.0) + duration * 60
-                total_minutes += duration * 60
+                by_status[a["status"]] = by_status.get(a["status"], 0) + duration
+                total_quarters += duration
 
             sheet_rems = [
                 {
-                    "start": max(r["start"], day_start) - day_start,
-                    "end": min(r["end"], day_end) - day_start,
+                    "start": quarters_to_hours(max(r["start"], day_start) - day_start),
+                    "end": quarters_to_hours(min(r["end"], day_end) - day_start),
                     "location": r["location"],
                     "information": r["information"],
                 }
@@ -435,9 +599,9 @@ class TripPlanner:
                     "activities": sheet_acts,
                     "remarks": sheet_rems,
                     "total_hours_by_status": {
-                        k: round(v / 60, 2) for k, v in by_status.items()
+                        k: quarters_to_hours(v) for k, v in by_status.items()
                     },
-                    "total_hours": round(total_minutes / 60, 2),
+                    "total_hours": quarters_to_hours(total_quarters),
                 }
             )
             day += 1
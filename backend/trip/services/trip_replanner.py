@@ -0,0 +1,198 @@
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+
+from trip.models import TripPlan
+from trip.services.map_client import MapClientProtocol
+from trip.services.poi_index import CorridorStop, POIIndex
+from trip.services.trip_planner import (
+    MAX_CYCLE_HOURS,
+    POI_CORRIDOR_KM,
+    POI_LOOKBACK_KM,
+    DutyLimitExceeded,
+    Leg,
+    TripPlanner,
+)
+from trip.utils.geo import cumulative_km, interpolate_at_km, project_onto_route
+from trip.utils.time import hours_to_quarters_up, quarters_to_hours
+
+ON_ROUTE_TOLERANCE_KM = 1.0
+
+
+class TripReplanner(TripPlanner):
+    """
+    Re-plans the remainder of a stored trip from a mid-trip GPS position and
+    the driver's current HOS counters. The truck is projected onto the stored
+    leg geometry; while it is on-route the remaining schedule is rebuilt from
+    the stored plan alone. Off-route, only the leg the truck is on is routed
+    again (from the GPS position, without geocoding).
+    """
+
+    def __init__(
+        self,
+        plan: TripPlan,
+        position: Tuple[float, float],
+        current_time: float,
+        driving_hours: float,
+        duty_hours: float,
+        cycle_used_hours: float,
+        km_since_refuel: float,
+        map_client: MapClientProtocol,
+        leg: Optional[str] = None,
+        on_route_km: float = ON_ROUTE_TOLERANCE_KM,
+        poi_index: Optional[POIIndex] = None,
+        poi_corridor_km: float = POI_CORRIDOR_KM,
+        poi_lookback_km: float = POI_LOOKBACK_KM,
+    ):
+        super().__init__(
+            current_location=f"{position[1]}, {position[0]}",
+            pickup_location=plan.input["pickup_location"],
+            dropoff_location=plan.input["dropoff_location"],
+            cycle_used_hours=cycle_used_hours,
+            map_client=map_client,
+            start_time=current_time,
+            poi_index=poi_index,
+            poi_corridor_km=poi_corridor_km,
+            poi_lookback_km=poi_lookback_km,
+        )
+        self.plan = plan
+        self.position = (position[0], position[1])
+        self.driving_hours = driving_hours
+        self.duty_hours = duty_hours
+        self.km_since_refuel = km_since_refuel
+        self.leg_hint = leg
+        self.on_route_km = on_route_km
+        # resolved from the stored plan, never geocoded again
+        self.coords = {
+            "current": self.position,
+            "pickup": tuple(plan.coords["pickup"]),
+            "dropoff": tuple(plan.coords["dropoff"]),
+        }
+
+    @cached_property
+    def projection(self) -> Tuple[int, float, float, int]:
+        """
+        (leg index, km along the leg, km off the route, segment index) of the
+        truck. Without a leg hint the closest leg wins; on a tie (e.g. at the
+        pickup) the earlier leg is kept so loading is not skipped.
+        """
+        candidates = []
+        for i, route in enumerate(self.plan.route_geometries):
+            if self.leg_hint and self.leg_hint != f"leg{i + 1}":
+                continue
+            km, offset, segment = project_onto_route(route, self.plan.route_km[i], self.position)
+            candidates.append((offset, i, km, segment))
+        offset, index, km, segment = min(candidates)
+        return index, km, offset, segment
+
+    @property
+    def on_route(self) -> bool:
+        return self.projection[2] <= self.on_route_km
+
+    @cached_property
+    def remaining_legs(self) -> List[Leg]:
+        index = self.projection[0]
+        specs = [
+            ("leg1", self.loading_time, self.pickup_location, "Pickup"),
+            ("leg2", self.unloading_time, self.dropoff_location, "Dropoff"),
+        ]
+        legs = []
+        for i in range(index, len(specs)):
+            name, load_time, location, info = specs[i]
+            if i == index:
+                drive_time, distance, route, route_km = self._current_leg_remainder(i)
+            else:
+                drive_time = hours_to_quarters_up(self.plan.drive_times[name])
+                distance = self.plan.leg_distances[name]
+                route = self.plan.route_geometries[i]
+                route_km = self.plan.route_km[i]
+            legs.append(
+                Leg(name, drive_time, distance, load_time, location, info, route, route_km=route_km)
+            )
+        return legs
+
+    def _current_leg_remainder(self, i: int) -> Tuple[int, float, List[List[float]], List[float]]:
+        """(drive quarter-hours, distance, geometry, cumulative km) left on the leg the truck is on."""
+        name = f"leg{i + 1}"
+        _, km, _, segment = self.projection
+        if self.on_route:
+            route = self.plan.route_geometries[i]
+            route_km = self.plan.route_km[i]
+            total_km = route_km[-1]
+            remaining = 1.0 - km / total_km if total_km else 0.0
+            start = list(interpolate_at_km(route, route_km, km))
+            tail = [start] + route[segment + 1:]
+            tail_km = [0.0] + [k - km for k in route_km[segment + 1:]]
+            return (
+                hours_to_quarters_up(self.plan.drive_times[name] * remaining),
+                self.plan.leg_distances[name] * remaining,
+                tail,
+                tail_km,
+            )
+
+        destination = self.coords["pickup"] if i == 0 else self.coords["dropoff"]
+        cell = self.map_client.matrix([self.position], [destination])
+        route = self.map_client.get_route_geometries([self.position, destination])[0]
+        return (
+            hours_to_quarters_up(cell["durations"][0][0]),
+            cell["distances"][0][0],
+            route,
+            cumulative_km(route),
+        )
+
+    @cached_property
+    def route_geometries(self) -> List[List[Tuple[float, float]]]:
+        return [leg.route for leg in self.remaining_legs]
+
+    @cached_property
+    def route_indexes(self) -> List[List[float]]:
+        return [leg.cumulative_km for leg in self.remaining_legs]
+
+    def plan_trip(self) -> Dict[str, Any]:
+        self._enforce_cycle_limit()
+        rests, log_sheets = self._build_plan_trip(
+            hours_to_quarters_up(self.driving_hours),
+            hours_to_quarters_up(self.duty_hours),
+            self.km_since_refuel,
+        )
+        index, km, offset, _ = self.projection
+        return {
+            "rests": rests,
+            "log_sheets": log_sheets,
+            "routes": self.route_geometries,
+            "position": {
+                "leg": f"leg{index + 1}",
+                "km_along": km,
+                "km_off_route": offset,
+                "on_route": self.on_route,
+            },
+        }
+
+    def _enforce_cycle_limit(self) -> None:
+        total_duty = quarters_to_hours(
+            sum(leg.drive_time + leg.load_time for leg in self.remaining_legs)
+        )
+        if self.cycle_used_hours + total_duty > MAX_CYCLE_HOURS:
+            raise DutyLimitExceeded(
+                f"Cycle would exceed {MAX_CYCLE_HOURS}h "
+                f"(used {self.cycle_used_hours:.1f} + need {total_duty:.1f})"
+            )
+
+    def _stop_location(
+        self, leg: Leg, stop: Optional[CorridorStop]
+    ) -> Tuple[Tuple[float, float], str]:
+        if stop is not None or not self.on_route:
+            return super()._stop_location(leg, stop)
+        # on-route re-plans make no upstream calls: name the stop by its position
+        coord = interpolate_at_km(leg.route, leg.cumulative_km, leg.km_covered)
+        return coord, f"{coord[1]:.3f}, {coord[0]:.3f}"
+
+    def _build_legs(self) -> List[Leg]:
+        return self.remaining_legs
+
+    def _add_start_off_duty(
+        self,
+        all_activities: List[Dict[str, Any]],
+        current_time: int
+    ) -> int:
+        # the hours before the re-plan are already on the driver's log
+        return current_time
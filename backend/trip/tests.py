@@ -1,3 +1,513 @@
-from django.test import TestCase
+import importlib.util
+import random
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from trip.models import TripPlan
+from trip.services import circuit_breaker, plan_jobs
+from trip.services.circuit_breaker import CircuitBreaker
+from trip.services.map_client import MapClient, ProviderUnavailableError
+from trip.services.poi_index import FUEL_KINDS, POI, REST_KINDS, CorridorStop, POIIndex, RouteCorridor
+from trip.services.trip_planner import TripPlanner
+from trip.services.trip_replanner import TripReplanner
+from trip.utils import time as time_utils
+from trip.utils.geo import as_plain_list, cumulative_km, haversine_km, interpolate_at_km
+from trip.utils.time import quarters_to_hours
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuit_breaker.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    def trip_open(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_lets_one_trial_through(self):
+        self.trip_open()
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_trial_closes(self):
+        self.trip_open()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_trial_reopens(self):
+        self.trip_open()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow_request())
+
+
+class ApiError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FakeORSClient:
+    def __init__(self):
+        self.error = None
+
+    def directions(self, **kwargs):
+        if self.error is not None:
+            raise self.error
+        return {"features": [{"geometry": {"coordinates": [[0.0, 0.0], [1.0, 1.0]]}}]}
+
+
+@override_settings(MAP_BREAKER_FAILURE_THRESHOLD=2, MAP_BREAKER_RESET_SECONDS=30)
+class MapClientBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuit_breaker.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        breakers = mock.patch.dict(circuit_breaker._breakers, clear=True)
+        breakers.start()
+        self.addCleanup(breakers.stop)
+
+        self.ors = FakeORSClient()
+        client = mock.patch("openrouteservice.Client", return_value=self.ors)
+        client.start()
+        self.addCleanup(client.stop)
+
+    def call(self, map_client=None):
+        # each plan builds its own client; the breaker is shared between them
+        map_client = map_client or MapClient(api_key="key", timeout=1.0)
+        return map_client._call_ors("directions", coordinates=[[0, 0], [1, 1]])
+
+    def test_server_errors_open_the_circuit(self):
+        self.ors.error = ApiError(503)
+        for _ in range(2):
+            with self.assertRaises(ApiError):
+                self.call()
+        self.ors.error = None
+        with self.assertRaises(ProviderUnavailableError):
+            self.call()
+
+    def test_client_error_on_half_open_trial_closes_the_circuit(self):
+        self.ors.error = ApiError(503)
+        for _ in range(2):
+            with self.assertRaises(ApiError):
+                self.call()
+        self.clock.now += 30
+
+        self.ors.error = ApiError(404)
+        with self.assertRaises(ApiError):
+            self.call()
+        self.ors.error = None
+        self.assertTrue(self.call()["features"])
+        self.assertEqual(circuit_breaker.get_breaker("ors").state, "closed")
+
+    def test_client_stops_calling_a_provider_after_its_first_failure(self):
+        map_client = MapClient(api_key="key", timeout=1.0)
+        self.ors.error = ApiError(503)
+        with self.assertRaises(ApiError):
+            self.call(map_client)
+        self.ors.error = None
+        with self.assertRaises(ProviderUnavailableError):
+            self.call(map_client)
+        # the circuit is still closed: other plans keep calling
+        self.assertTrue(self.call()["features"])
+
+    def test_client_errors_do_not_stop_the_client(self):
+        map_client = MapClient(api_key="key", timeout=1.0)
+        self.ors.error = ApiError(404)
+        with self.assertRaises(ApiError):
+            self.call(map_client)
+        self.ors.error = None
+        self.assertTrue(self.call(map_client)["features"])
+
+
+class LegMapClient:
+    """
+    Straight-line routes between named points. Leg drive hours come from
+    `hours` when given, else from the distance at `speed_kph`. Every upstream
+    call is recorded in `calls`.
+    """
+
+    def __init__(self, points, hours=None, speed_kph=80.0, vertices=2):
+        self.points = points
+        self.hours = {(points[a], points[b]): h for (a, b), h in (hours or {}).items()}
+        self.speed_kph = speed_kph
+        self.vertices = vertices
+        self.calls = []
+
+    def _hours(self, start, end):
+        start, end = tuple(start), tuple(end)
+        return self.hours.get((start, end), haversine_km(start, end) / self.speed_kph)
+
+    def batch_address_to_coords(self, addresses):
+        self.calls.append("batch_address_to_coords")
+        return [self.points[address] for address in addresses]
+
+    def matrix(self, sources, destinations):
+        self.calls.append("matrix")
+        return {
+            "durations": [[self._hours(s, d) for d in destinations] for s in sources],
+            "distances": [[haversine_km(s, d) for d in destinations] for s in sources],
+        }
+
+    def get_route_geometries(self, locations):
+        self.calls.append("get_route_geometries")
+        n = self.vertices - 1
+        return [
+            [[a[0] + (b[0] - a[0]) * k / n, a[1] + (b[1] - a[1]) * k / n] for k in range(n + 1)]
+            for a, b in zip(locations, locations[1:])
+        ]
+
+    def interpolate_along_route(self, route, current_km):
+        return interpolate_at_km(route, cumulative_km(route), current_km)
+
+    def reverse_geocode(self, lat, lon):
+        self.calls.append("reverse_geocode")
+        return f"{lat:.2f}, {lon:.2f}"
+
+
+class QuarterHourBatchTests(SimpleTestCase):
+    def setUp(self):
+        if importlib.util.find_spec("numpy") is None:
+            self.skipTest("numpy is not installed")
+        rng = random.Random(31)
+        quarters = [rng.randrange(0, 4000) / 4 for _ in range(50_000)]
+        self.hours = (
+            [rng.uniform(0, 1000) for _ in range(50_000)]
+            + quarters
+            # float noise either side of the grid, as left by summed leg times
+            + [q + rng.choice((-1, 1)) * rng.uniform(0, 1e-9) for q in quarters]
+            + [sum(rng.choice((0.1, 0.2, 0.05)) for _ in range(rng.randrange(1, 30))) for _ in range(50_000)]
+        )
+
+    def assert_matches_scalar(self, scalar, batch):
+        import numpy as np
+
+        expected = np.array([scalar(h) for h in self.hours])
+        actual = batch(self.hours)
+        self.assertEqual(actual.dtype, expected.dtype)
+        self.assertTrue(np.array_equal(actual, expected), scalar.__name__)
+
+    def test_batch_versions_match_scalar_versions(self):
+        self.assertEqual(len(self.hours), 200_000)
+        for scalar, batch in (
+            (time_utils.hours_to_quarters_up, time_utils.hours_to_quarters_up_batch),
+            (time_utils.hours_to_quarters_down, time_utils.hours_to_quarters_down_batch),
+            (time_utils.round_up_to_15min, time_utils.round_up_to_15min_batch),
+            (time_utils.round_down_to_15min, time_utils.round_down_to_15min_batch),
+        ):
+            self.assert_matches_scalar(scalar, batch)
+
+
+POINTS = {"A": (-100.0, 35.0), "B": (-97.0, 35.0), "C": (-78.0, 35.0)}
+
+
+class QuarterHourPlannerTests(SimpleTestCase):
+    """
+    Schedules recorded from the float-hour planner that the quarter-hour grid
+    replaced (A-B is ~273 km, B-C ~1728 km, no POI index).
+    """
+
+    def plan(self, hours, cycle_used_hours, start_time):
+        map_client = LegMapClient(POINTS, {("A", "B"): hours[0], ("B", "C"): hours[1]})
+        planner = TripPlanner("A", "B", "C", cycle_used_hours, map_client, start_time=start_time)
+        plan = planner.plan_trip()
+        days = [[(a["start"], a["end"], a["status"]) for a in day["activities"]] for day in plan["log_sheets"]]
+        stops = [
+            (kind, round(stop["coords"][0], 3))
+            for kind in ("duty_limit", "refill")
+            for stop in plan["rests"][kind]
+        ]
+        return days, stops
+
+    def test_matches_float_planner_with_refuel(self):
+        days, stops = self.plan((3.1, 20.3), cycle_used_hours=10, start_time=5)
+        self.assertEqual(days, [
+            [(0, 5, "Off Duty"), (5, 8.25, "Driving"), (8.25, 9.25, "On Duty"),
+             (9.25, 17, "Driving"), (17, 24, "Off Duty")],
+            [(0, 3, "Off Duty"), (3, 3.5, "On Duty"), (3.5, 14.5, "Driving"), (14.5, 24, "Off Duty")],
+            [(0, 0.5, "Off Duty"), (0.5, 2.25, "Driving"), (2.25, 3.25, "On Duty"), (3.25, 24, "Off Duty")],
+        ])
+        self.assertEqual(stops, [("duty_limit", -89.817), ("duty_limit", -79.622), ("refill", -89.817)])
+
+    def test_matches_float_planner_across_midnight(self):
+        days, stops = self.plan((3.4, 19.9), cycle_used_hours=40, start_time=22)
+        self.assertEqual(days, [
+            [(0, 22, "Off Duty"), (22, 24, "Driving")],
+            [(0, 1.5, "Driving"), (1.5, 2.5, "On Duty"), (2.5, 10, "Driving"), (10, 20, "Off Duty"),
+             (20, 20.5, "On Duty"), (20.5, 24, "Driving")],
+            [(0, 7.5, "Driving"), (7.5, 17.5, "Off Duty"), (17.5, 19, "Driving"), (19, 20, "On Duty"),
+             (20, 24, "Off Duty")],
+        ])
+        self.assertEqual(stops, [("duty_limit", -89.875), ("duty_limit", -79.425), ("refill", -89.875)])
+
+    def test_float_noise_no_longer_adds_a_quarter(self):
+        # the float planner rounded 3.0000000000000004 h up to 3.25 h and
+        # delivered a quarter-hour later; otherwise the schedules are the same
+        days, stops = self.plan((3.0000000000000004, 19.2), cycle_used_hours=0, start_time=7.25)
+        self.assertEqual(days, [
+            [(0, 7.25, "Off Duty"), (7.25, 10.25, "Driving"), (10.25, 11.25, "On Duty"),
+             (11.25, 19.25, "Driving"), (19.25, 24, "Off Duty")],
+            [(0, 5.25, "Off Duty"), (5.25, 5.75, "On Duty"), (5.75, 16.75, "Driving"), (16.75, 24, "Off Duty")],
+            [(0, 2.75, "Off Duty"), (2.75, 3, "Driving"), (3, 4, "On Duty"), (4, 24, "Off Duty")],
+        ])
+        self.assertEqual(stops, [("duty_limit", -89.104), ("duty_limit", -78.247), ("refill", -89.104)])
+
+
+class TripReplannerTests(SimpleTestCase):
+    def setUp(self):
+        # stored the way store_plan does, without touching the database
+        planner = TripPlanner("A", "B", "C", 0, LegMapClient(POINTS))
+        self.plan = TripPlan(
+            input={"pickup_location": "B", "dropoff_location": "C"},
+            coords=planner.coords,
+            drive_times={leg: quarters_to_hours(q) for leg, q in planner.drive_times.items()},
+            leg_distances=planner.leg_distances,
+            route_geometries=[as_plain_list(route) for route in planner.route_geometries],
+            route_km=[as_plain_list(km) for km in planner.route_indexes],
+        )
+        self.map_client = LegMapClient(POINTS)
+
+    def replan(self, position, **kwargs):
+        hos = {"current_time": 8, "driving_hours": 6, "duty_hours": 7, "cycle_used_hours": 20, "km_since_refuel": 900}
+        hos.update(kwargs)
+        return TripReplanner(self.plan, position, map_client=self.map_client, **hos)
+
+    def point_on_leg(self, index, km):
+        return interpolate_at_km(self.plan.route_geometries[index], self.plan.route_km[index], km)
+
+    def test_projects_position_onto_the_closest_leg(self):
+        index, km, offset, _ = self.replan(self.point_on_leg(1, 500)).projection
+        self.assertEqual(index, 1)
+        self.assertAlmostEqual(km, 500, delta=1)
+        self.assertLess(offset, 0.01)
+
+    def test_tie_at_pickup_keeps_leg1_so_loading_is_not_skipped(self):
+        replanner = self.replan(POINTS["B"])
+        self.assertEqual(replanner.projection[0], 0)
+        body = replanner.plan_trip()
+        self.assertEqual(body["position"]["leg"], "leg1")
+        first_remark = body["log_sheets"][0]["remarks"][0]
+        self.assertEqual(first_remark["information"], "Pickup")
+
+    def test_leg_hint_overrides_the_closest_leg(self):
+        self.assertEqual(self.replan(POINTS["B"], leg="leg2").projection[0], 1)
+
+    def test_on_route_replan_makes_no_map_calls(self):
+        body = self.replan(self.point_on_leg(1, 300)).plan_trip()
+        self.assertTrue(body["position"]["on_route"])
+        self.assertTrue(body["rests"]["duty_limit"])
+        self.assertEqual(self.map_client.calls, [])
+
+    def test_off_route_replan_reroutes_only_the_current_leg(self):
+        lon, lat = self.point_on_leg(0, 100)
+        position = (lon, lat + 0.2)  # ~22 km north of leg 1
+        body = self.replan(position).plan_trip()
+
+        self.assertFalse(body["position"]["on_route"])
+        self.assertEqual(self.map_client.calls.count("matrix"), 1)
+        self.assertEqual(self.map_client.calls.count("get_route_geometries"), 1)
+        self.assertNotIn("batch_address_to_coords", self.map_client.calls)
+        self.assertEqual(body["routes"][0], [list(position), list(POINTS["B"])])
+        self.assertEqual(body["routes"][1], self.plan.route_geometries[1])
+
+
+class POIIndexTests(SimpleTestCase):
+    def setUp(self):
+        # ~91 km along the 35th parallel, a vertex every ~9 km
+        self.route = [[-100.0 + k / 10, 35.0] for k in range(11)]
+        self.cum_km = cumulative_km(self.route)
+
+    def test_corridor_keeps_pois_within_width_keyed_to_closest_vertex(self):
+        near = POI("Near", "truck_stop", -99.5, 35.018)
+        between = POI("Between", "fuel", -99.47, 35.0)
+        too_far = POI("Too far", "truck_stop", -99.5, 35.09)
+        past_end = POI("Past end", "rest_area", -98.9, 35.0)
+        corridor = POIIndex([near, between, too_far, past_end]).corridor(self.route, self.cum_km, 5.0)
+
+        stops = {stop.poi.name: stop for stop in corridor.stops}
+        self.assertEqual(set(stops), {"Near", "Between"})
+        self.assertEqual(stops["Near"].km, self.cum_km[5])
+        self.assertAlmostEqual(stops["Near"].offset_km, 2.0, delta=0.05)
+        self.assertEqual(stops["Between"].km, self.cum_km[5])
+        self.assertAlmostEqual(stops["Between"].offset_km, 2.7, delta=0.05)
+
+    def test_best_stop_is_furthest_in_window_of_allowed_kind(self):
+        def stop(name, kind, km, offset):
+            return CorridorStop(POI(name, kind, 0.0, 0.0), km=km, offset_km=offset)
+
+        corridor = RouteCorridor([
+            stop("Early", "truck_stop", 10, 1),
+            stop("Fuel", "fuel", 40, 2),
+            stop("Truck stop", "truck_stop", 40, 3),
+            stop("Rest area", "rest_area", 40, 1),
+            stop("Late", "truck_stop", 90, 1),
+        ])
+
+        # furthest wins; at the same km the stop closest to the road does
+        self.assertEqual(corridor.best_stop(REST_KINDS, 0, 80).poi.name, "Rest area")
+        self.assertEqual(corridor.best_stop(FUEL_KINDS, 0, 80).poi.name, "Fuel")
+        # both ends of the window are inclusive
+        self.assertEqual(corridor.best_stop(REST_KINDS, 0, 90).poi.name, "Late")
+        self.assertEqual(corridor.best_stop(REST_KINDS, 10, 39).poi.name, "Early")
+        self.assertIsNone(corridor.best_stop(frozenset({"fuel"}), 41, 89))
+
+    def plan_with_poi(self, kind):
+        map_client = LegMapClient(POINTS, vertices=200)
+        route = map_client.get_route_geometries([POINTS["B"], POINTS["C"]])[0]
+        lon, lat = interpolate_at_km(route, cumulative_km(route), 560)
+        poi_index = POIIndex([POI("Stop 560", kind, lon, lat + 0.01)])
+        planner = TripPlanner("A", "B", "C", 0, map_client, poi_index=poi_index)
+        plan = planner.plan_trip()
+        corridor = poi_index.corridor(planner.route_geometries[1], planner.route_indexes[1], planner.poi_corridor_km)
+        return planner, plan, corridor.stops[0]
+
+    def test_rest_is_snapped_to_poi_the_truck_reaches(self):
+        planner, plan, poi_stop = self.plan_with_poi("truck_stop")
+        rest = plan["rests"]["duty_limit"][0]
+        self.assertEqual(rest["coords"], poi_stop.poi.coords)
+        self.assertIn("Stop 560", rest["name"])
+
+        # the leg-2 drive before the rest covers at least the POI's km on the route
+        day = plan["log_sheets"][0]
+        self.assertEqual(day["remarks"][-1]["location"], "Stop 560")
+        drive = day["activities"][-2]
+        self.assertEqual((drive["status"], drive["end"]), ("Driving", day["remarks"][-1]["start"]))
+        kph = planner.leg_distances["leg2"] / quarters_to_hours(planner.drive_times["leg2"])
+        self.assertGreaterEqual((drive["end"] - drive["start"]) * kph, poi_stop.km)
+
+    def test_rest_is_not_snapped_to_fuel_only_poi(self):
+        _, plan, _ = self.plan_with_poi("fuel")
+        self.assertNotIn("Stop 560", plan["rests"]["duty_limit"][0]["name"])
+
+
+class SyncExecutor:
+    """Runs submitted jobs inline, so a submission has finished when the request returns."""
+
+    def __init__(self, run=True):
+        self.run = run
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        if self.run:
+            fn(*args)
+
+
+class PlanJobAPITests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.run_plan = mock.Mock(return_value=({"rests": {}, "log_sheets": [], "routes": []}, 200))
+        self.executor = SyncExecutor()
+        for target, value in (
+            ("run_plan", self.run_plan),
+            ("_get_executor", lambda: self.executor),
+            # jobs run inline here, on the test's own connection
+            ("connections", mock.Mock()),
+        ):
+            patcher = mock.patch.object(plan_jobs, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.data = {
+            "current_location": "Dallas, TX",
+            "pickup_location": "Tulsa, OK",
+            "dropoff_location": "Chicago, IL",
+            "cycle_used_hours": 10,
+        }
+
+    def submit(self, data=None):
+        response = self.client.post(reverse("plan-job-create"), data or self.data, format="json")
+        self.assertEqual(response.status_code, 202)
+        return response.data["job_id"]
+
+    def poll(self, job_id, wait=None):
+        params = {} if wait is None else {"wait": wait}
+        return self.client.get(reverse("plan-job-detail", args=[job_id]), params)
+
+    def test_duplicate_input_reuses_the_finished_job(self):
+        job_id = self.submit()
+        duplicate = dict(self.data, pickup_location="  tulsa,   OK ", cycle_used_hours=10.001)
+        self.assertEqual(self.submit(duplicate), job_id)
+        self.assertEqual(self.run_plan.call_count, 1)
+
+        response = self.poll(job_id)
+        self.assertEqual(response.data["status"], "succeeded")
+        self.assertEqual(response.data["http_status"], 200)
+
+    def test_upstream_failure_is_rerun_on_resubmission(self):
+        self.run_plan.return_value = ({"error": "Map service error: down"}, 502)
+        job_id = self.submit()
+        self.assertEqual(self.poll(job_id).data["http_status"], 502)
+
+        self.run_plan.return_value = ({"rests": {}, "log_sheets": [], "routes": []}, 200)
+        self.assertEqual(self.submit(), job_id)
+        self.assertEqual(self.run_plan.call_count, 2)
+        self.assertEqual(self.poll(job_id).data["status"], "succeeded")
+
+    def test_invalid_input_failure_is_not_rerun(self):
+        self.run_plan.return_value = ({"error": "Could not geocode address"}, 400)
+        job_id = self.submit()
+        self.assertEqual(self.submit(), job_id)
+        self.assertEqual(self.run_plan.call_count, 1)
+        self.assertEqual(self.poll(job_id).data["status"], "failed")
+
+    def test_degraded_result_is_rerun_on_resubmission(self):
+        self.run_plan.return_value = ({"degraded": True, "degraded_reasons": ["durations from cache"]}, 200)
+        job_id = self.submit()
+        self.run_plan.return_value = ({"degraded": False}, 200)
+        self.assertEqual(self.submit(), job_id)
+        self.assertEqual(self.run_plan.call_count, 2)
+        self.assertFalse(self.poll(job_id).data["result"]["degraded"])
+
+    def test_long_poll_returns_the_pending_job_at_the_timeout(self):
+        self.executor.run = False
+        job_id = self.submit()
+
+        started = time.monotonic()
+        response = self.poll(job_id, wait=0.3)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertNotIn("result", response.data)
+
+    def test_poll_rejects_bad_wait_and_unknown_jobs(self):
+        job_id = self.submit()
+        self.assertEqual(self.poll(job_id, wait="soon").status_code, 400)
+        self.assertEqual(self.poll("00000000-0000-0000-0000-000000000000").status_code, 404)
@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import PlanTripAPIView
+from .views import PlanJobCreateAPIView, PlanJobDetailAPIView, PlanTripAPIView, ReplanTripAPIView
 
 urlpatterns = [
     path('plan-trip/', PlanTripAPIView.as_view(), name='plan-trip'),
+    path('plans/<uuid:plan_id>/replan/', ReplanTripAPIView.as_view(), name='plan-replan'),
+    path('plan-jobs/', PlanJobCreateAPIView.as_view(), name='plan-job-create'),
+    path('plan-jobs/<uuid:job_id>/', PlanJobDetailAPIView.as_view(), name='plan-job-detail'),
 ]
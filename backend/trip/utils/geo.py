@@ -0,0 +1,154 @@
+import math
+from bisect import bisect_left
+from typing import Dict, Generic, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+
+EARTH_RADIUS_KM = 6371.0088
+
+T = TypeVar("T")
+
+
+def haversine_km(p1: Tuple[float, float], p2: Tuple[float, float]) -> float:
+    """
+    Great-circle distance in kilometers between two (lon, lat) points.
+    """
+    lon1, lat1 = math.radians(p1[0]), math.radians(p1[1])
+    lon2, lat2 = math.radians(p2[0]), math.radians(p2[1])
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cumulative_km(route: Sequence[Sequence[float]]) -> List[float]:
+    """
+    Cumulative-km route index: entry i is the distance along the route
+    from route[0] to route[i].
+    """
+    cum = [0.0] * len(route)
+    for i in range(1, len(route)):
+        cum[i] = cum[i - 1] + haversine_km(route[i - 1], route[i])
+    return cum
+
+
+def as_plain_list(values: Sequence) -> list:
+    """
+    JSON-ready copy of a route or cumulative-km index, whether it is held
+    as a list or as a NumPy array view.
+    """
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+def interpolate_at_km(
+    route: Sequence[Sequence[float]], cum_km: Sequence[float], km: float
+) -> Tuple[float, float]:
+    """
+    Return the (lon, lat) point at `km` along the route using its
+    cumulative-km index (binary search instead of re-measuring segments).
+    """
+    if len(route) == 0:
+        raise ValueError("Route is empty")
+    if km <= 0:
+        return (route[0][0], route[0][1])
+    i = bisect_left(cum_km, km)
+    if i >= len(route):
+        return (route[-1][0], route[-1][1])
+    seg_km = cum_km[i] - cum_km[i - 1]
+    ratio = (km - cum_km[i - 1]) / seg_km if seg_km else 0.0
+    lon = route[i - 1][0] + ratio * (route[i][0] - route[i - 1][0])
+    lat = route[i - 1][1] + ratio * (route[i][1] - route[i - 1][1])
+    return (lon, lat)
+
+
+def project_onto_route(
+    route: Sequence[Sequence[float]],
+    cum_km: Sequence[float],
+    point: Tuple[float, float],
+) -> Tuple[float, float, int]:
+    """
+    Project a (lon, lat) point onto the route polyline.
+    Returns (km along the route, km off the route, index of the segment start).
+    Uses a local flat projection around the point, which is accurate at the
+    few-km scale an on-route check cares about.
+    """
+    if len(route) == 0:
+        raise ValueError("Route is empty")
+    if len(route) == 1:
+        return 0.0, haversine_km(point, (route[0][0], route[0][1])), 0
+
+    px, py = point
+    kx = 111.320 * math.cos(math.radians(py))
+    ky = 110.574
+    best = (math.inf, 0.0, 0)  # (offset_km, km_along, segment)
+    for i in range(len(route) - 1):
+        ax, ay = (route[i][0] - px) * kx, (route[i][1] - py) * ky
+        bx, by = (route[i + 1][0] - px) * kx, (route[i + 1][1] - py) * ky
+        dx, dy = bx - ax, by - ay
+        seg_sq = dx * dx + dy * dy
+        t = 0.0 if seg_sq == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / seg_sq))
+        offset = math.hypot(ax + t * dx, ay + t * dy)
+        if offset < best[0]:
+            best = (offset, cum_km[i] + t * (cum_km[i + 1] - cum_km[i]), i)
+    return best[1], best[0], best[2]
+
+
+class GridIndex(Generic[T]):
+    """
+    Uniform lon/lat bucket index for nearest / radius lookups on point data.
+    `cell_deg` should be at least as large as the typical query radius so a
+    lookup only touches the 3x3 cells around the query point.
+    """
+
+    def __init__(self, cell_deg: float = 0.25):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, T]]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def cell_of(self, lon: float, lat: float) -> Tuple[int, int]:
+        return (math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def insert(self, lon: float, lat: float, item: T) -> None:
+        self._cells.setdefault(self.cell_of(lon, lat), []).append((lon, lat, item))
+        self._size += 1
+
+    def cell_items(self, cell: Tuple[int, int]) -> List[Tuple[float, float, T]]:
+        return self._cells.get(cell, [])
+
+    def neighbour_cells(self, lon: float, lat: float, radius_km: float) -> Iterator[Tuple[int, int]]:
+        cx, cy = self.cell_of(lon, lat)
+        # degrees of longitude shrink with latitude
+        lat_span = radius_km / 111.0
+        lon_span = radius_km / max(1e-6, 111.0 * math.cos(math.radians(lat)))
+        rx = int(math.ceil(lon_span / self.cell_deg))
+        ry = int(math.ceil(lat_span / self.cell_deg))
+        for dx in range(-rx, rx + 1):
+            for dy in range(-ry, ry + 1):
+                yield (cx + dx, cy + dy)
+
+    def within(self, lon: float, lat: float, radius_km: float) -> List[Tuple[float, T]]:
+        """Return (distance_km, item) pairs within `radius_km`, nearest first."""
+        found = []
+        for cell in self.neighbour_cells(lon, lat, radius_km):
+            for item_lon, item_lat, item in self.cell_items(cell):
+                dist = haversine_km((lon, lat), (item_lon, item_lat))
+                if dist <= radius_km:
+                    found.append((dist, item))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def nearest(self, lon: float, lat: float, max_km: float) -> Tuple[float, T]:
+        """Return the nearest (distance_km, item) within `max_km`; raises LookupError."""
+        found = self.within(lon, lat, max_km)
+        if not found:
+            raise LookupError(f"No point within {max_km} km of ({lon}, {lat})")
+        return found[0]
+
+    @classmethod
+    def from_points(cls, points: Iterable[Tuple[float, float, T]], cell_deg: float = 0.25) -> "GridIndex[T]":
+        index = cls(cell_deg)
+        for lon, lat, item in points:
+            index.insert(lon, lat, item)
+        return index
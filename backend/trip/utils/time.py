@@ -1,6 +1,11 @@
 import math
 from datetime import datetime
 
+QUARTERS_PER_HOUR = 4
+# Absorbs float noise such as 2.2500000000000004 h before snapping to the grid.
+# The scalar and NumPy versions apply the same IEEE operations, so they agree bit-for-bit.
+GRID_EPSILON = 1e-9
+
 
 def get_current_time_rounded_up() -> float:
     """
@@ -15,16 +20,69 @@ def get_current_time_rounded_up() -> float:
     return hours + minutes / 60
 
 
+def hours_to_quarters_up(hours: float) -> int:
+    """
+    Converts float hours to whole quarter-hours, rounding up.
+    Example: 1.02 → 5, 2.25 → 9
+    """
+    return math.ceil(hours * QUARTERS_PER_HOUR - GRID_EPSILON)
+
+
+def hours_to_quarters_down(hours: float) -> int:
+    """
+    Converts float hours to whole quarter-hours, rounding down.
+    Example: 1.12 → 4, 2.60 → 10
+    """
+    return math.floor(hours * QUARTERS_PER_HOUR + GRID_EPSILON)
+
+
+def quarters_to_hours(quarters: int) -> float:
+    """
+    Converts quarter-hours back to float hours (exact for any int).
+    Example: 9 → 2.25
+    """
+    return quarters / QUARTERS_PER_HOUR
+
+
 def round_up_to_15min(hours: float) -> float:
     """
     Rounds any float hour value to the next 15-minute block.
     Example: 1.02 → 1.25, 2.6 → 2.75
     """
-    return math.ceil(hours * 4) / 4
+    return quarters_to_hours(hours_to_quarters_up(hours))
 
 def round_down_to_15min(hours: float) -> float:
     """
     Rounds any float hour value down to the previous 15-minute block.
     Example: 1.12 → 1.00, 2.60 → 2.50
     """
-    return math.floor(hours * 4) / 4
+    return quarters_to_hours(hours_to_quarters_down(hours))
+
+
+# NumPy batch versions for sweeps. NumPy is imported on first use so the
+# planner itself does not pay for it at import time.
+
+def hours_to_quarters_up_batch(hours):
+    """Vectorized `hours_to_quarters_up`; returns an int64 array."""
+    import numpy as np
+
+    values = np.asarray(hours, dtype=np.float64)
+    return np.ceil(values * QUARTERS_PER_HOUR - GRID_EPSILON).astype(np.int64)
+
+
+def hours_to_quarters_down_batch(hours):
+    """Vectorized `hours_to_quarters_down`; returns an int64 array."""
+    import numpy as np
+
+    values = np.asarray(hours, dtype=np.float64)
+    return np.floor(values * QUARTERS_PER_HOUR + GRID_EPSILON).astype(np.int64)
+
+
+def round_up_to_15min_batch(hours):
+    """Vectorized `round_up_to_15min`; returns a float64 array."""
+    return hours_to_quarters_up_batch(hours) / QUARTERS_PER_HOUR
+
+
+def round_down_to_15min_batch(hours):
+    """Vectorized `round_down_to_15min`; returns a float64 array."""
+    return hours_to_quarters_down_batch(hours) / QUARTERS_PER_HOUR
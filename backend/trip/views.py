@@ -1,40 +1,91 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings 
-from trip.services.map_client import InvalidAddressError, MapAPIError, MapClient
-from trip.services.trip_planner import DutyLimitExceeded, TripPlanner
+from django.conf import settings
+from django.urls import reverse
+from trip.services.plan_jobs import submit_plan_job, wait_for_job
+from trip.models import TripPlan
+from trip.services.plan_runner import run_plan, run_replan, trip_plan_cutoff
+from trip.services.profiling import PROFILE_ID_HEADER, profile_call, profiling_requested
 
-from .serializers import TripInputSerializer
+from .serializers import ReplanInputSerializer, TripInputSerializer
 
 
 
 class PlanTripAPIView(APIView):
+    def dispatch(self, request, *args, **kwargs):
+        # profiling is opt-in per request and only when enabled in settings
+        if not (settings.PLAN_PROFILING_ENABLED and profiling_requested(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+        response, profile_id = profile_call(
+            lambda: self._dispatch_and_render(request, *args, **kwargs),
+            settings.PLAN_PROFILE_DIR,
+        )
+        if profile_id is not None:
+            response[PROFILE_ID_HEADER] = profile_id
+        return response
+
+    def _dispatch_and_render(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # render here so serialization is part of the profile
+        return response.render()
+
     def post(self, request):
         serializer = TripInputSerializer(data=request.data)
         if serializer.is_valid():
-            try:
-                map_client = MapClient(api_key=settings.OPENROUTESERVICE_API_KEY)
+            # ✅ Generate trip plan
+            plan, plan_status = run_plan(serializer.validated_data)
+            return Response(plan, status=plan_status)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-                planner = TripPlanner(
-                    current_location=serializer.validated_data['current_location'],
-                    pickup_location=serializer.validated_data['pickup_location'],
-                    dropoff_location=serializer.validated_data['dropoff_location'],
-                    cycle_used_hours=serializer.validated_data['cycle_used_hours'],
-                    map_client=map_client
-                )
 
-                # ✅ Generate trip plan
-                plan = planner.plan_trip()
-                return Response(plan, status=status.HTTP_200_OK)
+class ReplanTripAPIView(APIView):
+    def post(self, request, plan_id):
+        serializer = ReplanInputSerializer(data=request.data)
+        if serializer.is_valid():
+            plan = TripPlan.objects.filter(pk=plan_id, created_at__gte=trip_plan_cutoff()).first()
+            if plan is None:
+                return Response({"error": "Plan not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            except InvalidAddressError as e:
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            body, plan_status = run_replan(plan, serializer.validated_data)
+            return Response(body, status=plan_status)
 
-            except DutyLimitExceeded as e:
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            except MapAPIError as e:
-                return Response({"error": f"Map service error: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+
+class PlanJobCreateAPIView(APIView):
+    def post(self, request):
+        serializer = TripInputSerializer(data=request.data)
+        if serializer.is_valid():
+            job = submit_plan_job(serializer.validated_data)
+            return Response(
+                {
+                    "job_id": str(job.pk),
+                    "status": job.status,
+                    "status_url": reverse("plan-job-detail", args=[job.pk]),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PlanJobDetailAPIView(APIView):
+    def get(self, request, job_id):
+        try:
+            wait = float(request.query_params.get("wait", 0))
+        except ValueError:
+            return Response({"error": "'wait' must be a number of seconds"}, status=status.HTTP_400_BAD_REQUEST)
+        wait = min(max(wait, 0.0), settings.PLAN_JOB_MAX_WAIT_SECONDS)
+
+        job = wait_for_job(job_id, wait)
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        body = {"job_id": str(job.pk), "status": job.status}
+        if job.is_finished:
+            body["http_status"] = job.http_status
+            body["result"] = job.result
+        return Response(body, status=status.HTTP_200_OK)